@@ -0,0 +1,131 @@
+"""Query caching for the Email Assistant."""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Import configuration
+from config import config
+
+
+def _normalize(vector):
+    """Return vector as a float32 unit vector."""
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+def normalize_query(text):
+    """Return the cache key for a question: stripped and lowercased."""
+    return text.strip().lower()
+
+
+class SemanticQueryCache:
+    """
+    LRU cache of answers keyed by query embedding.
+
+    A lookup hits when a cached query's embedding is within the cosine
+    similarity threshold of the new query's and the entry is younger than the
+    TTL, so near-duplicate questions reuse an answer instead of re-running the
+    retrieval and LLM chain.
+    """
+
+    def __init__(self, max_size=256, ttl=300.0, threshold=0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        # query text -> (unit embedding, answer, timestamp)
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, query_vector):
+        """
+        Return the cached answer closest to query_vector, or None on a miss.
+
+        Args:
+            query_vector: Embedding of the incoming query
+
+        Returns:
+            Cached answer string or None
+        """
+        with self._lock:
+            self._evict_expired()
+            if not self._entries:
+                return None
+
+            keys = list(self._entries)
+            matrix = np.stack([self._entries[k][0] for k in keys])
+            scores = matrix @ _normalize(query_vector)
+
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            key = keys[best]
+            self._entries.move_to_end(key)
+            return self._entries[key][1]
+
+    def put(self, query, query_vector, answer):
+        """Cache answer for query under its embedding."""
+        query = normalize_query(query)
+        with self._lock:
+            self._entries[query] = (_normalize(query_vector), answer, time.monotonic())
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached answer, e.g. after the vector store changes."""
+        with self._lock:
+            self._entries.clear()
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        expired = [k for k, (_, _, ts) in self._entries.items() if ts < cutoff]
+        for key in expired:
+            del self._entries[key]
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that memoizes embed_query results.
+
+    Lets the semantic cache lookup and the retriever share one embedding
+    request for the same query text. Queries that differ only in case or
+    surrounding whitespace share an entry.
+    """
+
+    def __init__(self, base, max_size=1000):
+        self.base = base
+        self.max_size = max_size
+        self._vectors = OrderedDict()
+        self._lock = threading.RLock()
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            if key in self._vectors:
+                self._vectors.move_to_end(key)
+                return self._vectors[key]
+
+        vector = self.base.embed_query(text)
+
+        with self._lock:
+            self._vectors[key] = vector
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+        return vector
+
+
+# Shared answer cache used by agent_email_query, invalidated by agent_email_vector
+query_cache = SemanticQueryCache(
+    max_size=config.QUERY_CACHE_SIZE,
+    ttl=config.QUERY_CACHE_TTL,
+    threshold=config.QUERY_CACHE_THRESHOLD,
+)
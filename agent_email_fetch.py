@@ -1,9 +1,10 @@
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel
 
 
 class EmailData(BaseModel):
+    id: str = ""
     sender: str
     subject: str
     date: str
@@ -14,17 +15,64 @@ class EmailResponse(BaseModel):
     emails: List[EmailData]
 
 
+import asyncio
+import atexit
 import email
+import email.parser
+import email.policy
 import imaplib
+import re
+import threading
 from datetime import datetime
 from email.header import decode_header
 
 from langchain.tools import tool
 
+# Import configuration
+from config import config
+
+IMAP_HOST = "imap.gmail.com"
+
+# Header fields fetched in the first pass; everything else stays on the server
+HEADER_FIELDS = "FROM SUBJECT DATE MESSAGE-ID CONTENT-TYPE"
+
+# Tokens of an IMAP FETCH response: parens, quoted strings and atoms.
+# Atoms may carry a section spec, e.g. BODY[HEADER.FIELDS (FROM SUBJECT)]
+_FETCH_TOKEN = re.compile(
+    rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    rb"|(?P<atom>[^\s()\"\[\]]+(?:\[[^\]]*\][^\s()]*)?))"
+)
+_LITERAL_MARKER = re.compile(rb"\{\d+\}$")
+_FETCH_START = re.compile(rb"^\d+ \(")
+_OPEN = object()
+_CLOSE = object()
+
+# One header line plus any folded continuation lines
+_HEADER_LINE = re.compile(
+    rb"^(From|Subject|Date|Message-ID):[ \t]*(.*(?:\r?\n[ \t].*)*)", re.M | re.I
+)
+_FOLD = re.compile(rb"\r?\n(?=[ \t])")
+
+# Bytes handed to the MIME parser per feed() call
+_FEED_CHUNK_SIZE = 64 * 1024
+
+# Idle logged-in clients keyed by (host, email), reused across fetches.
+# A client is checked out for the duration of one fetch so concurrent
+# fetches never share a connection.
+_IMAP_POOL: dict[tuple[str, str], list[imaplib.IMAP4_SSL]] = {}
+_IMAP_POOL_LOCK = threading.RLock()
+
 
 def decode(value):
+    if value is None:
+        return ""
     if isinstance(value, bytes):
         value = value.decode(errors="ignore")
+
+    # Most headers contain no RFC 2047 encoded word; skip decode_header for them
+    if "=?" not in value:
+        return str(value)
+
     parts = decode_header(value)
     decoded = ""
     for item, enc in parts:
@@ -35,128 +83,537 @@ def decode(value):
     return decoded
 
 
-@tool("fetch_emails")
-def fetch_emails(email_id: str, app_password: str, start_date: str, end_date: str):
+def _logout(imap):
+    try:
+        imap.logout()
+    except:
+        pass
+
+
+def _acquire_imap(email_id, app_password):
     """
-    Fetch all emails between start_date and end_date (inclusive).
+    Check out a logged-in IMAP client for email_id, reusing an idle one if alive.
+
+    Idle clients are probed with NOOP first; ones the server dropped are
+    discarded. A fresh connection is opened when no idle client is usable.
+    """
+    key = (IMAP_HOST, email_id)
+    while True:
+        with _IMAP_POOL_LOCK:
+            idle = _IMAP_POOL.get(key)
+            imap = idle.pop() if idle else None
+        if imap is None:
+            break
+        try:
+            imap.noop()
+            return imap
+        except (imaplib.IMAP4.abort, OSError):
+            _logout(imap)
+
+    imap = imaplib.IMAP4_SSL(IMAP_HOST)
+    try:
+        imap.login(email_id, app_password)
+    except Exception:
+        # Close the socket of a connection that never authenticated
+        _logout(imap)
+        raise
+
+    # Capabilities grow after LOGIN; refresh them and turn on CONDSTORE so
+    # SELECT reports HIGHESTMODSEQ for incremental syncs
+    status, data = imap.capability()
+    if status == "OK" and data:
+        imap.capabilities = tuple(data[-1].decode().upper().split())
+    if "CONDSTORE" in imap.capabilities and "ENABLE" in imap.capabilities:
+        imap.enable("CONDSTORE")
+    return imap
+
+
+def _release_imap(email_id, imap):
+    """Close the selected mailbox and return the client to the pool."""
+    try:
+        imap.close()
+    except:
+        pass
+    with _IMAP_POOL_LOCK:
+        _IMAP_POOL.setdefault((IMAP_HOST, email_id), []).append(imap)
+
+
+@atexit.register
+def _close_imap_pool():
+    """Log out every pooled client at interpreter shutdown."""
+    with _IMAP_POOL_LOCK:
+        clients = [imap for idle in _IMAP_POOL.values() for imap in idle]
+        _IMAP_POOL.clear()
+    for imap in clients:
+        _logout(imap)
+
+
+def _tokenize(pieces):
+    """Tokenize the raw pieces of one message's FETCH response."""
+    tokens = []
+    for piece in pieces:
+        if isinstance(piece, tuple):
+            text, literal = piece[0], piece[1]
+            text = _LITERAL_MARKER.sub(b"", text.rstrip())
+        else:
+            text, literal = piece, None
+
+        text = text.rstrip()
+        pos = 0
+        while pos < len(text):
+            match = _FETCH_TOKEN.match(text, pos)
+            if not match:
+                raise ValueError(f"Unexpected FETCH response: {text[pos:pos + 40]!r}")
+            pos = match.end()
+            if match.group("open"):
+                tokens.append(_OPEN)
+            elif match.group("close"):
+                tokens.append(_CLOSE)
+            elif match.group("quoted") is not None:
+                tokens.append(re.sub(rb"\\(.)", rb"\1", match.group("quoted")))
+            else:
+                atom = match.group("atom")
+                tokens.append(None if atom.upper() == b"NIL" else atom)
+
+        if literal is not None:
+            tokens.append(literal)
+    return tokens
+
+
+def _nest(tokens):
+    """Turn a flat token list into nested lists following the parens."""
+    stack = [[]]
+    for token in tokens:
+        if token is _OPEN:
+            stack.append([])
+        elif token is _CLOSE:
+            if len(stack) > 1:
+                inner = stack.pop()
+                stack[-1].append(inner)
+        else:
+            stack[-1].append(token)
+    while len(stack) > 1:
+        inner = stack.pop()
+        stack[-1].append(inner)
+    return stack[0]
+
+
+def _parse_fetch_response(msg_data):
+    """
+    Parse an imaplib FETCH response into per-message data items.
 
     Args:
-        email_id: Gmail address
-        app_password: Gmail app password
-        start_date: Start date in YYYY-MM-DD format
-        end_date: End date in YYYY-MM-DD format
+        msg_data: Data list returned by ``imap.fetch``
 
     Returns:
-        Dictionary with 'emails' key containing list of email dictionaries
+        List of (message number, {ITEM NAME: value}) tuples
+    """
+    groups = []
+    for item in msg_data:
+        if item is None:
+            continue
+        head = item[0] if isinstance(item, tuple) else item
+        if _FETCH_START.match(head):
+            groups.append([])
+        if groups:
+            groups[-1].append(item)
+
+    messages = []
+    for pieces in groups:
+        try:
+            parsed = _nest(_tokenize(pieces))
+            num, values = parsed[0], parsed[1]
+            items = {
+                name.decode("ascii", errors="ignore").upper(): value
+                for name, value in zip(values[::2], values[1::2])
+                if isinstance(name, bytes)
+            }
+        except (ValueError, IndexError):
+            continue
+        messages.append((num, items))
+    return messages
+
+
+def _get_item(items, prefix):
+    """Return the first data item whose name starts with prefix."""
+    for name, value in items.items():
+        if name.startswith(prefix):
+            return value
+    return None
+
+
+def _is_attachment(structure):
+    """Return True if a single-part BODYSTRUCTURE is marked as an attachment."""
+    # Text parts carry an extra line-count field before the extension data
+    index = 9 if (structure[0] or b"").lower() == b"text" else 8
+    disposition = structure[index] if len(structure) > index else None
+    return (
+        isinstance(disposition, list)
+        and bool(disposition)
+        and (disposition[0] or b"").lower() == b"attachment"
+    )
 
-    Raises:
-        Exception: If authentication fails or connection issues occur
+
+def _find_text_part(structure):
     """
-    imap = None
+    Locate the first inline text/plain part in a BODYSTRUCTURE.
+
+    The tree is walked depth-first in MIME order and the walk stops at the
+    first match. HTML, attachments and non-text leaves are skipped outright
+    and attached messages (message/rfc822) are never descended into.
+
+    Args:
+        structure: Parsed BODYSTRUCTURE list
+
+    Returns:
+        Tuple of (section, charset, transfer encoding) or None if not found
+    """
+    stack = [(structure, "")]
+    while stack:
+        node, section = stack.pop()
+
+        if node and isinstance(node[0], list):
+            # Multipart: child parts come first, followed by the subtype.
+            # Push in reverse so the first child is visited first.
+            children = []
+            for i, child in enumerate(node, 1):
+                if not isinstance(child, list):
+                    break
+                children.append((child, f"{section}.{i}" if section else str(i)))
+            stack.extend(reversed(children))
+            continue
+
+        if len(node) < 6:
+            continue
+
+        maintype = (node[0] or b"").lower()
+        subtype = (node[1] or b"").lower()
+
+        # A single-part message is section 1 and is used whatever its text
+        # subtype; inside a multipart only inline text/plain qualifies
+        if maintype != b"text":
+            continue
+        if section and (subtype != b"plain" or _is_attachment(node)):
+            continue
+
+        params = node[2] if isinstance(node[2], list) else []
+        params = {
+            (k or b"").lower(): v for k, v in zip(params[::2], params[1::2])
+        }
+        charset = (params.get(b"charset") or b"utf-8").decode("ascii", errors="ignore")
+        encoding = (node[5] or b"7bit").decode("ascii", errors="ignore")
+
+        return section or "1", charset, encoding
+
+    return None
+
+
+def _decode_part(raw, charset, encoding):
+    """
+    Decode a fetched MIME section using its charset and transfer encoding.
+
+    The section is streamed into the parser in chunks behind a synthetic
+    header block, so no concatenated copy of the body is ever built.
+    """
+    prelude = (
+        f'Content-Type: text/plain; charset="{charset}"\r\n'
+        f"Content-Transfer-Encoding: {encoding}\r\n\r\n"
+    ).encode("ascii", errors="ignore")
+
+    parser = email.parser.BytesFeedParser(policy=email.policy.default)
+    parser.feed(prelude)
+    view = memoryview(raw)
+    for start in range(0, len(view), _FEED_CHUNK_SIZE):
+        parser.feed(bytes(view[start : start + _FEED_CHUNK_SIZE]))
+    part = parser.close()
+
+    # The default policy decodes transfer encoding and charset in one step
     try:
-        # Connect and login
-        imap = imaplib.IMAP4_SSL("imap.gmail.com")
-        imap.login(email_id, app_password)
-        imap.select("INBOX")
+        return part.get_content()
+    except LookupError:
+        # Unknown charset: fall back to a lenient UTF-8 decode
+        payload = part.get_payload(decode=True) or b""
+        return payload.decode(errors="ignore")
 
-        # Format for IMAP (DD-Mon-YYYY)
-        sd = datetime.strptime(start_date, "%Y-%m-%d").strftime("%d-%b-%Y")
-        ed = datetime.strptime(end_date, "%Y-%m-%d").strftime("%d-%b-%Y")
 
-        query = f'(SINCE "{sd}" BEFORE "{ed}")'
-        status, data = imap.search(None, query)
+def _parse_headers(raw):
+    """
+    Extract From, Subject, Date and Message-ID from a raw header block.
 
-        if status != "OK":
-            return {"emails": []}
-
-        email_list = []
-
-        for num in data[0].split():
-            status, msg_data = imap.fetch(num, "(RFC822)")
-            if status != "OK":
-                continue
-
-            msg = email.message_from_bytes(msg_data[0][1])
-
-            sender = decode(msg.get("From"))
-            subject = decode(msg.get("Subject"))
-            date = msg.get("Date")
-
-            body = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    if part.get_content_type() == "text/plain":
-                        try:
-                            body = part.get_payload(decode=True).decode(errors="ignore")
-                        except:
-                            pass
-                        break
-            else:
-                try:
-                    payload = msg.get_payload(decode=True)
-                    if payload:
-                        body = payload.decode(errors="ignore")
-                except:
-                    body = ""
-
-            email_list.append(
-                {
-                    "sender": sender,
-                    "subject": subject,
-                    "date": date,
-                    "body": body,
-                }
-            )
+    Pure-ASCII blocks, the common case since RFC 2047 encoded words are ASCII
+    too, are scanned with a single precompiled regex instead of building an
+    email.message.Message. Anything else goes through the email parser.
+
+    Args:
+        raw: Header block bytes
+
+    Returns:
+        Dictionary keyed by lowercase header name
+    """
+    if raw.isascii():
+        headers = {}
+        for name, value in _HEADER_LINE.findall(raw):
+            key = name.decode("ascii").lower()
+            if key not in headers:
+                headers[key] = _FOLD.sub(b"", value).strip().decode("ascii")
+        return headers
+
+    msg = email.message_from_bytes(raw, policy=email.policy.default)
+    return {
+        key: str(msg[key])
+        for key in ("from", "subject", "date", "message-id")
+        if msg[key] is not None
+    }
+
+
+def _optimize_sequence(uids):
+    """
+    Compact UIDs into an IMAP sequence set, e.g. b"1:100,120,130:140".
+
+    Search results are mostly consecutive UIDs, so ranges keep the FETCH
+    command short even for large windows.
+
+    Args:
+        uids: UIDs as bytes or ints, in any order
+
+    Returns:
+        Sequence set as bytes
+    """
+    numbers = sorted({int(uid) for uid in uids})
+    ranges = []
+    start = prev = numbers[0]
+    for n in numbers[1:]:
+        if n != prev + 1:
+            ranges.append(f"{start}:{prev}" if prev > start else str(start))
+            start = n
+        prev = n
+    ranges.append(f"{start}:{prev}" if prev > start else str(start))
+    return ",".join(ranges).encode()
+
+
+def _response_int(imap, code):
+    """Return the integer value of an untagged response code, or None."""
+    _, data = imap.response(code)
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError):
+        return None
+
+
+def _fetch_window(imap, start_date, end_date, sync_state=None):
+    """
+    Fetch the emails of one date window over a logged-in client.
+
+    Messages are addressed by UID so they stay stable across sessions. When
+    sync_state holds the mailbox's UIDVALIDITY and MODSEQ high-water mark from
+    a previous fetch of this window, only messages changed since then are
+    returned (IMAP CONDSTORE); a UIDVALIDITY change forces a full resync.
+
+    Args:
+        imap: Logged-in IMAP client
+        start_date: Start date in YYYY-MM-DD format
+        end_date: End date in YYYY-MM-DD format
+        sync_state: Optional {"uidvalidity", "highestmodseq"} from a previous fetch
 
-        return {"emails": email_list}
+    Returns:
+        Tuple of (list of email dictionaries, new sync state)
+    """
+    imap.select("INBOX", readonly=True)
+
+    new_state = {
+        "uidvalidity": _response_int(imap, "UIDVALIDITY"),
+        "highestmodseq": _response_int(imap, "HIGHESTMODSEQ"),
+    }
+
+    # Format for IMAP (DD-Mon-YYYY)
+    sd = datetime.strptime(start_date, "%Y-%m-%d").strftime("%d-%b-%Y")
+    ed = datetime.strptime(end_date, "%Y-%m-%d").strftime("%d-%b-%Y")
+
+    query = f'SINCE "{sd}" BEFORE "{ed}"'
+
+    last_modseq = (sync_state or {}).get("highestmodseq")
+    if (
+        last_modseq
+        and new_state["highestmodseq"]
+        and sync_state.get("uidvalidity") == new_state["uidvalidity"]
+    ):
+        query += f" MODSEQ {last_modseq + 1}"
+
+    status, data = imap.uid("SEARCH", f"({query})")
+
+    if status != "OK":
+        return [], sync_state
+
+    # A MODSEQ search appends "(MODSEQ n)" after the UIDs
+    uids = data[0].split(b"(")[0].split()
+    if not uids:
+        return [], new_state
+
+    # Pass 1: headers and MIME structure only, for every message at once.
+    # PEEK keeps the server from flagging the messages as \Seen.
+    uid_set = _optimize_sequence(uids)
+    status, msg_data = imap.uid(
+        "FETCH", uid_set, f"(BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})] BODYSTRUCTURE)"
+    )
+    if status != "OK":
+        return [], sync_state
+
+    messages = [
+        (items.get("UID"), items) for _, items in _parse_fetch_response(msg_data)
+    ]
+
+    # Group messages by the section holding their text/plain body so each
+    # distinct section number costs one bulk FETCH
+    text_parts = {}
+    sections = {}
+    for uid, items in messages:
+        structure = items.get("BODYSTRUCTURE")
+        part = _find_text_part(structure) if isinstance(structure, list) else None
+        if uid and part:
+            text_parts[uid] = part
+            sections.setdefault(part[0], []).append(uid)
+
+    # Pass 2: download only the text/plain sections
+    bodies = {}
+    for section, section_uids in sections.items():
+        status, body_data = imap.uid(
+            "FETCH", _optimize_sequence(section_uids), f"(BODY.PEEK[{section}])"
+        )
+        if status != "OK":
+            continue
+        for _, items in _parse_fetch_response(body_data):
+            uid = items.get("UID")
+            raw = items.get(f"BODY[{section}]")
+            if uid in text_parts and isinstance(raw, bytes):
+                _, charset, encoding = text_parts[uid]
+                bodies[uid] = _decode_part(raw, charset, encoding)
+
+    email_list = []
+
+    for uid, items in messages:
+        header = _get_item(items, "BODY[HEADER")
+        if not isinstance(header, bytes):
+            continue
+
+        headers = _parse_headers(header)
+
+        sender = decode(headers.get("from"))
+        subject = decode(headers.get("subject"))
+        date = headers.get("date", "")
+        message_id = headers.get("message-id", "").strip()
+
+        email_list.append(
+            {
+                "id": message_id,
+                "sender": sender,
+                "subject": subject,
+                "date": date,
+                "body": bodies.get(uid, ""),
+            }
+        )
+
+    return email_list, new_state
+
+
+def _fetch_pooled(email_id, app_password, start_date, end_date, sync_state=None):
+    """Fetch one date window over a pooled connection."""
+    imap = None
+    try:
+        # Reuse a pooled connection (skips TLS handshake and LOGIN)
+        imap = _acquire_imap(email_id, app_password)
+        return _fetch_window(imap, start_date, end_date, sync_state)
 
     except imaplib.IMAP4.error as e:
+        # The connection state is unknown after an IMAP error; don't reuse it
+        if imap:
+            _logout(imap)
+            imap = None
         raise Exception(f"IMAP authentication failed: {e}")
     except Exception as e:
         raise Exception(f"Failed to fetch emails: {e}")
     finally:
-        # Ensure proper cleanup
+        # Close the mailbox but keep the connection pooled for the next fetch
         if imap:
-            try:
-                imap.close()
-                imap.logout()
-            except:
-                pass
-
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
-from langchain_ollama import ChatOllama
-
-# Import your fetch_emails tool
-from agent_email_fetch import fetch_emails
-
-if __name__ == "__main__":
-    # Use local Ollama Llama 3.1 model
-    llm = ChatOllama(
-        model="llama3.1:8b",
-        temperature=0.2
-    )
+            _release_imap(email_id, imap)
 
-    # Create a ReAct agent using LangGraph
-    email_agent = create_react_agent(
-        llm,
-        tools=[fetch_emails]
-    )
 
-    # Invoke the agent
-    response = email_agent.invoke(
-        {
-            "messages": [
-                HumanMessage(
-                    content=(
-                        "Fetch my emails. "
-                        "Email: kansesup@gmail.com, "
-                        "App Password: rkpu ugcr tcgw qsjx, "
-                        "Start: 2025-11-20, End: 2025-11-22"
-                    )
-                )
-            ]
-        }
+@tool("fetch_emails")
+def fetch_emails(
+    email_id: str,
+    app_password: str,
+    start_date: str,
+    end_date: str,
+    sync_state: Optional[dict] = None,
+):
+    """
+    Fetch all emails between start_date and end_date (inclusive).
+
+    Args:
+        email_id: Gmail address
+        app_password: Gmail app password
+        start_date: Start date in YYYY-MM-DD format
+        end_date: End date in YYYY-MM-DD format
+        sync_state: Optional sync state returned by a previous fetch of the
+            same range; only emails changed since then are returned
+
+    Returns:
+        Dictionary with 'emails' key containing list of email dictionaries and
+        'sync_state' key to pass to the next fetch of this range
+
+    Raises:
+        Exception: If authentication fails or connection issues occur
+    """
+    emails, state = _fetch_pooled(
+        email_id, app_password, start_date, end_date, sync_state
     )
+    return {"emails": emails, "sync_state": state}
+
+
+async def fetch_emails_async(
+    email_id: str,
+    app_password: str,
+    date_windows: list[tuple[str, str]],
+    sync_states: Optional[list[Optional[dict]]] = None,
+    max_connections: int = None,
+):
+    """
+    Fetch several date windows concurrently over separate IMAP connections.
+
+    Each window runs the blocking imaplib fetch in a worker thread; a
+    semaphore caps how many connections are open at once so the account
+    stays under Gmail's per-account connection limit.
 
-    print(response)
+    Args:
+        email_id: Gmail address
+        app_password: Gmail app password
+        date_windows: List of (start_date, end_date) tuples in YYYY-MM-DD format
+        sync_states: Optional sync state per window from a previous fetch
+        max_connections: Maximum concurrent connections (uses config if not provided)
+
+    Returns:
+        Dictionary with 'emails' key containing the emails of every window,
+        in window order, and 'sync_states' key with the new state per window
+
+    Raises:
+        Exception: If authentication fails or connection issues occur
+    """
+    semaphore = asyncio.Semaphore(max_connections or config.IMAP_MAX_CONNECTIONS)
+
+    sync_states = sync_states or [None] * len(date_windows)
+
+    async def fetch_window(start_date, end_date, sync_state):
+        async with semaphore:
+            return await asyncio.to_thread(
+                _fetch_pooled, email_id, app_password, start_date, end_date, sync_state
+            )
+
+    results = await asyncio.gather(
+        *(
+            fetch_window(start, end, state)
+            for (start, end), state in zip(date_windows, sync_states)
+        )
+    )
+    return {
+        "emails": [e for emails, _ in results for e in emails],
+        "sync_states": [state for _, state in results],
+    }
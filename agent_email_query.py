@@ -1,32 +1,111 @@
+import functools
 import os
+import re
+import sys
+from collections import Counter
+from email.utils import parseaddr
+from typing import Any, List
 
+from langchain_community.chat_message_histories import FileChatMessageHistory
 from langchain_community.vectorstores import Chroma
+from langchain_core.callbacks import BaseCallbackHandler, CallbackManagerForRetrieverRun
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.documents import Document
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_ollama import ChatOllama, OllamaEmbeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_ollama import ChatOllama
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain.retrievers import ContextualCompressionRetriever
+from langchain.memory import ConversationBufferWindowMemory
 
 # Import configuration
 from config import config
-
-# Initialize embeddings (same as in agent_email_vector.py)
-embeddings = OllamaEmbeddings(
-    model=config.OLLAMA_EMBEDDING_MODEL,
-    base_url=config.OLLAMA_BASE_URL,
+from agent_email_cache import CachedQueryEmbeddings, query_cache
+from agent_email_vector import (
+    count_documents,
+    get_embedder,
+    load_flat_index,
+    open_vector_store,
 )
 
-# Initialize LLM
-llm = ChatOllama(
-    model=config.OLLAMA_LLM_MODEL,
-    temperature=config.LLM_TEMPERATURE,
-    base_url=config.OLLAMA_BASE_URL,
-)
 
-# Define the custom prompt for the QA part of the chain
-CUSTOM_PROMPT_TEMPLATE = """You are an intelligent email assistant. Answer the user's question based ONLY on the provided chat history and the retrieved email context.
-Be concise, accurate, and helpful. If the context doesn't contain enough information to answer the question, state that you don't have enough information from the emails, but try to use the chat history to provide a conversational answer if possible.
+@functools.lru_cache(maxsize=1)
+def get_embeddings():
+    """
+    Return the query embeddings, created on first use.
+
+    Query embeddings are memoized so the cache lookup and the retriever share
+    one request for the standalone question. The underlying client is the one
+    agent_email_vector used for indexing.
+    """
+    return CachedQueryEmbeddings(
+        get_embedder(), max_size=config.QUERY_EMBEDDING_CACHE_SIZE
+    )
+
+
+# Tag on the LLM that writes the final answer, so streaming skips the
+# question-condensing call
+ANSWER_TAG = "email_answer"
+
+
+@functools.lru_cache(maxsize=2)
+def get_llm(tag=None):
+    """
+    Return the chat LLM, created on first use.
+
+    Args:
+        tag: Optional run tag, used to tell the answer LLM's tokens apart
+
+    Returns:
+        ChatOllama instance
+    """
+    return ChatOllama(
+        model=config.OLLAMA_LLM_MODEL,
+        temperature=config.LLM_TEMPERATURE,
+        base_url=config.OLLAMA_BASE_URL,
+        keep_alive=config.OLLAMA_KEEP_ALIVE,
+        tags=[tag] if tag else None,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_reranker():
+    """Return the cross-encoder reranker, loaded on first use."""
+    # Optional dependency, only needed when RERANKER_MODEL is set
+    import torch
+    from langchain.retrievers.document_compressors import CrossEncoderReranker
+    from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+
+    # Inference only: match the CLI's thread budget and skip autograd
+    torch.set_num_threads(int(os.environ.get("OMP_NUM_THREADS", os.cpu_count())))
+    torch.set_grad_enabled(False)
+
+    return CrossEncoderReranker(
+        model=HuggingFaceCrossEncoder(model_name=config.RERANKER_MODEL),
+        top_n=config.RERANK_TOP_N,
+    )
+
+
+class AnswerStreamHandler(BaseCallbackHandler):
+    """Write the answer LLM's tokens to stdout as they are generated."""
+
+    def on_llm_new_token(self, token, *, tags=None, **kwargs):
+        if tags and ANSWER_TAG in tags:
+            sys.stdout.write(token)
+            sys.stdout.flush()
 
-Chat History:
+
+# Define the custom prompt for the QA part of the chain. The instructions are
+# a fixed system message so every request starts with the same prefix and
+# Ollama can reuse its evaluation; only the human message changes per turn.
+SYSTEM_PROMPT = """You are an intelligent email assistant. Answer the user's question based ONLY on the provided chat history and the retrieved email context.
+Be concise, accurate, and helpful. If the context doesn't contain enough information to answer the question, state that you don't have enough information from the emails, but try to use the chat history to provide a conversational answer if possible."""
+
+# Chat history comes first since it only grows between turns, while the
+# retrieved context changes with every question
+HUMAN_PROMPT_TEMPLATE = """Chat History:
 {chat_history}
 
 Retrieved Email Context:
@@ -36,16 +115,175 @@ Question: {question}
 
 Answer:"""
 
+# Parsed once at import and shared by every chain
+QA_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        SystemMessage(content=SYSTEM_PROMPT),
+        ("human", HUMAN_PROMPT_TEMPLATE),
+    ]
+)
+
+
+# Questions answered from stored metadata alone, matched against the whole
+# question so anything more specific still goes to the LLM
+_COUNT_QUESTION = re.compile(
+    r"how many (?:e-?mails|messages)(?: did i (?:receive|get))?", re.I
+)
+# The sender must be a single address or name word ending the question, so
+# "from Bob last week" and other qualified questions go to the LLM
+_FROM_QUESTION = re.compile(
+    r"how many (?:e-?mails|messages)(?: did i (?:receive|get))?"
+    r" from ([\w.+-]+@[\w.-]+|[\w'-]+)",
+    re.I,
+)
+_SENDERS_QUESTION = re.compile(
+    r"(?:list|show)(?: me)?(?: all)?(?: the)?(?: email)? senders"
+    r"|who (?:has )?sent me (?:e-?mails|messages)",
+    re.I,
+)
+_NAME_WORD = re.compile(r"[\w'-]+")
+# Words that name a time rather than a sender
+_DATE_WORDS = frozenset(
+    "today yesterday tonight week month year monday tuesday wednesday thursday"
+    " friday saturday sunday january february march april may june july august"
+    " september october november december".split()
+)
+
+
+def _sender_matches(sender, token):
+    """
+    Return whether a From header matches a sender token.
+
+    An address token must equal the sender's address; any other token must
+    equal a whole word of the display name or of the address's local part.
+    """
+    name, address = parseaddr(sender)
+    address = address.lower()
+    if "@" in token:
+        return address == token
+    words = _NAME_WORD.findall(name.lower()) + _NAME_WORD.findall(
+        address.split("@")[0]
+    )
+    return token in words
+
+
+def answer_from_metadata(vectorstore, question):
+    """
+    Answer simple counting questions from Chroma metadata, without the LLM.
+
+    Handles "How many emails did I receive?", "How many emails did I
+    receive from <sender>?" and "List all senders"; anything else, including
+    a sender that matches no stored email, returns None and should go
+    through the conversational chain.
+
+    Args:
+        vectorstore: Chroma or PGVector vector store instance
+        question: User's question about emails
+
+    Returns:
+        Answer string, or None if the question needs the LLM
+    """
+    if not isinstance(vectorstore, Chroma):
+        return None
+
+    text = question.strip().rstrip("?.! ")
+
+    if _COUNT_QUESTION.fullmatch(text):
+        return f"You have {count_documents(vectorstore)} emails indexed."
+
+    match = _FROM_QUESTION.fullmatch(text)
+    if match and match.group(1).lower() in _DATE_WORDS:
+        return None
+
+    senders = None
+    if match or _SENDERS_QUESTION.fullmatch(text):
+        metadatas = vectorstore._collection.get(include=["metadatas"])["metadatas"]
+        senders = Counter(m.get("sender", "") for m in metadatas)
+
+    if match:
+        token = match.group(1).lower()
+        total = sum(n for sender, n in senders.items() if _sender_matches(sender, token))
+        if not total:
+            return None
+        return f"You received {total} emails from {match.group(1)}."
+
+    if senders is not None:
+        lines = [
+            f"- {sender} ({n} email{'s' if n != 1 else ''})"
+            for sender, n in senders.most_common()
+        ]
+        return f"You received emails from {len(senders)} senders:\n" + "\n".join(lines)
+
+    return None
+
+
+class FlatIndexRetriever(BaseRetriever):
+    """Retriever doing exact cosine search over an in-memory FlatIndex."""
+
+    index: Any
+    embeddings: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        _, rows = self.index.search(self.embeddings.embed_query(query), self.k)
+        return [
+            Document(
+                page_content=self.index.documents[i],
+                metadata=self.index.metadatas[i] or {},
+            )
+            for i in rows
+        ]
+
+
+def create_retriever(vectorstore):
+    """
+    Create the retriever used by the conversational chain.
+
+    Small Chroma collections are loaded into a FlatIndex for exact search;
+    larger ones use Chroma's HNSW index, and pgvector stores search in SQL.
+    When RERANKER_MODEL is set, the candidates are reranked by a cross-encoder
+    and only the best RERANK_TOP_N are returned.
+
+    Args:
+        vectorstore: Chroma or PGVector vector store instance
+
+    Returns:
+        LangChain retriever
+    """
+    k = config.DEFAULT_RETRIEVAL_COUNT
+    retriever = None
+
+    if (
+        isinstance(vectorstore, Chroma)
+        and 0 < count_documents(vectorstore) <= config.FLAT_INDEX_MAX_DOCS
+    ):
+        index = load_flat_index(vectorstore)
+        if index is not None:
+            retriever = FlatIndexRetriever(
+                index=index, embeddings=get_embeddings(), k=k
+            )
+
+    if retriever is None:
+        retriever = vectorstore.as_retriever(search_kwargs={"k": k})
+
+    if config.RERANKER_MODEL:
+        retriever = ContextualCompressionRetriever(
+            base_compressor=get_reranker(), base_retriever=retriever
+        )
+    return retriever
+
 
 def load_vector_store(persist_directory=None):
     """
-    Load the existing ChromaDB vector store from disk.
+    Load the existing vector store (ChromaDB from disk, or pgvector).
 
     Args:
         persist_directory: Directory where ChromaDB data is stored (uses config if not provided)
 
     Returns:
-        Loaded Chroma vectorstore instance
+        Loaded Chroma or PGVector vectorstore instance
 
     Raises:
         FileNotFoundError: If vector store doesn't exist
@@ -53,75 +291,161 @@ def load_vector_store(persist_directory=None):
     persist_dir = persist_directory or config.CHROMA_PERSIST_DIRECTORY
 
     # Check if vector store exists
-    if not os.path.exists(persist_dir):
+    if config.VECTOR_BACKEND == "chroma" and not os.path.exists(persist_dir):
         raise FileNotFoundError(
             f"Vector store not found at '{persist_dir}'. "
             "Please run the workflow to fetch and index emails first."
         )
 
     try:
-        vectorstore = Chroma(
-            collection_name=config.CHROMA_COLLECTION_NAME,
-            embedding_function=embeddings,
-            persist_directory=persist_dir,
-        )
+        vectorstore = open_vector_store(persist_dir, embedding=get_embeddings())
         return vectorstore
     except Exception as e:
         raise Exception(f"Failed to load vector store: {e}")
 
 
-def create_conversational_query_chain(vectorstore):
+def chat_history_path():
+    """Return the chat history file for the configured store and account."""
+    key = f"{config.VECTOR_BACKEND}-{config.CHROMA_COLLECTION_NAME}-{config.EMAIL_ID}"
+    filename = re.sub(r"[^\w.@-]", "_", key) + ".json"
+    return os.path.join(os.path.expanduser(config.CHAT_HISTORY_DIR), filename)
+
+
+def create_conversational_query_chain(vectorstore, persist_history=True):
     """
     Create a ConversationalRetrievalChain with memory for querying emails.
 
+    The chat history is kept in a file under CHAT_HISTORY_DIR, one per vector
+    backend, collection and account, so a new session resumes the previous
+    conversation about the same mailbox; only the last CHAT_HISTORY_TURNS
+    exchanges are put in the prompt.
+
     Args:
-        vectorstore: ChromaDB vector store instance
+        vectorstore: Chroma or PGVector vector store instance
+        persist_history: Load and save the chat history on disk
 
     Returns:
         ConversationalRetrievalChain instance
     """
-    # Create a memory buffer to store chat history
-    memory = ConversationBufferMemory(
+    if persist_history:
+        history_path = chat_history_path()
+        os.makedirs(os.path.dirname(history_path), exist_ok=True)
+        chat_history = FileChatMessageHistory(history_path, encoding="utf-8")
+    else:
+        chat_history = InMemoryChatMessageHistory()
+
+    # Create a memory window over the recent chat history
+    memory = ConversationBufferWindowMemory(
+        chat_memory=chat_history,
+        k=config.CHAT_HISTORY_TURNS,
         memory_key="chat_history",
         return_messages=True,  # Important for some LLMs/chains
         output_key='answer'
     )
 
     # Create the retriever from the vectorstore
-    retriever = vectorstore.as_retriever(
-        search_kwargs={"k": config.DEFAULT_RETRIEVAL_COUNT}
-    )
-    
-    # Create the prompt template for the final QA step
-    qa_prompt = ChatPromptTemplate.from_template(CUSTOM_PROMPT_TEMPLATE)
+    retriever = create_retriever(vectorstore)
 
-    # Create the ConversationalRetrievalChain
+    # Create the ConversationalRetrievalChain; the follow-up question is
+    # condensed by an untagged LLM so only the answer is streamed
     qa_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
+        llm=get_llm(ANSWER_TAG),
+        condense_question_llm=get_llm(),
         retriever=retriever,
         memory=memory,
         return_source_documents=False,
-        combine_docs_chain_kwargs={"prompt": qa_prompt},
+        combine_docs_chain_kwargs={"prompt": QA_PROMPT},
     )
 
     return qa_chain
 
 
-def query_emails(qa_chain, user_query):
+def trim_chat_history(qa_chain):
+    """
+    Drop chat history older than the memory window.
+
+    Called when an interactive session ends, so the history file stays
+    bounded to the last CHAT_HISTORY_TURNS exchanges.
+
+    Args:
+        qa_chain: The ConversationalRetrievalChain instance
+    """
+    history = qa_chain.memory.chat_memory
+    keep = 2 * config.CHAT_HISTORY_TURNS
+    messages = history.messages
+    if len(messages) > keep:
+        history.clear()
+        history.add_messages(messages[-keep:])
+
+
+def _standalone_question(qa_chain, user_query, chat_history):
+    """
+    Rewrite a follow-up question so it stands on its own.
+
+    Mirrors ConversationalRetrievalChain: with no chat history the question
+    is used as is, otherwise the chain's question generator condenses it.
+    """
+    if not chat_history:
+        return user_query
+    result = qa_chain.question_generator.invoke(
+        {"question": user_query, "chat_history": chat_history}
+    )
+    return result[qa_chain.question_generator.output_key].strip()
+
+
+def query_emails(qa_chain, user_query, use_cache=True, stream=False):
     """
     Query the email vector store using the created conversational chain.
 
+    The chain's steps are run here so the semantic query cache can be keyed
+    on the standalone question: follow-ups are condensed with the chat
+    history first, so "the email from that sender" is cached under the
+    sender it refers to. Near-duplicate standalone questions asked within
+    the cache TTL reuse the answer without retrieval or the answer LLM.
+
     Args:
         qa_chain: The ConversationalRetrievalChain instance
         user_query: User's question about emails
+        use_cache: Whether to look up and store answers in the query cache
+        stream: Write the answer to stdout token by token as it is generated
 
     Returns:
         Natural language response from the LLM
     """
     try:
-        # The chain handles everything: history, retrieval, and generation
-        result = qa_chain.invoke({"question": user_query})
-        return result['answer']
+        memory = qa_chain.memory
+        history = memory.load_memory_variables({})[memory.memory_key]
+        chat_history = (qa_chain.get_chat_history or _get_chat_history)(history)
+        question = _standalone_question(qa_chain, user_query, chat_history)
+
+        answer = None
+        if use_cache:
+            query_vector = get_embeddings().embed_query(question)
+            answer = query_cache.get(query_vector)
+            if answer is not None and stream:
+                sys.stdout.write(answer)
+                sys.stdout.flush()
+
+        if answer is None:
+            callbacks = [AnswerStreamHandler()] if stream else []
+            docs = qa_chain.retriever.invoke(
+                question, config={"callbacks": callbacks}
+            )
+            result = qa_chain.combine_docs_chain.invoke(
+                {
+                    "input_documents": docs,
+                    "question": question,
+                    "chat_history": chat_history,
+                },
+                config={"callbacks": callbacks},
+            )
+            answer = result[qa_chain.combine_docs_chain.output_key]
+            if use_cache:
+                query_cache.put(question, query_vector, answer)
+
+        # Record the exchange as the user asked it, as the chain would
+        memory.save_context({"question": user_query}, {"answer": answer})
+        return answer
 
     except Exception as e:
         raise Exception(f"Failed to query emails: {e}")
@@ -137,7 +461,7 @@ if __name__ == "__main__":
         qa_chain = create_conversational_query_chain(vectorstore)
 
         # Get collection count
-        count = vectorstore._collection.count()
+        count = count_documents(vectorstore)
         print(f"✓ Vector store loaded successfully")
         print(f"✓ Total emails in store: {count}")
         print("\n" + "=" * 50)
@@ -1,19 +1,338 @@
-import uuid
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 from email_reply_parser import EmailReplyParser
-from langchain.tools import tool
 from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
 from langchain_ollama import OllamaEmbeddings
 
 # Import configuration
 from config import config
+from agent_email_cache import query_cache
 
 # from talon.signature import extract as extract_signature
 
-embeddings = OllamaEmbeddings(
-    model=config.OLLAMA_EMBEDDING_MODEL,
-    base_url=config.OLLAMA_BASE_URL,
-)
+REQUIRED_EMAIL_KEYS = ("sender", "subject", "date", "body")
+
+# Below this many emails a process pool costs more to start than it saves
+PARALLEL_CLEAN_THRESHOLD = 200
+
+# Rows of int8 codes widened to float32 at a time while scoring
+_SCORE_BLOCK_ROWS = 4096
+
+# Embedding clients shared by the indexing and query phases, keyed by model
+_MODEL_CACHE = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+
+class TruncatedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper keeping only the first `dim` components of each vector.
+
+    Matryoshka-trained models such as nomic-embed-text put the most
+    information in the leading dimensions, so a shortened, re-normalized
+    vector keeps most of the retrieval quality at a fraction of the memory
+    and distance-computation cost.
+    """
+
+    def __init__(self, base, dim):
+        self.base = base
+        self.dim = dim
+
+    def _truncate(self, vectors):
+        v = np.asarray(vectors, dtype=np.float32)[:, : self.dim]
+        norms = np.linalg.norm(v, axis=1, keepdims=True)
+        return (v / np.where(norms == 0, 1, norms)).tolist()
+
+    def embed_documents(self, texts):
+        return self._truncate(self.base.embed_documents(texts))
+
+    def embed_query(self, text):
+        return self._truncate([self.base.embed_query(text)])[0]
+
+
+def get_embedder(model=None):
+    """
+    Return the shared Ollama embeddings client for a model.
+
+    The client is created once per process, so the workflow command moves
+    from indexing to querying without setting it up again. Each request asks
+    Ollama to keep the model loaded for OLLAMA_KEEP_ALIVE seconds. When
+    EMBEDDING_DIM is set, vectors are shortened to that many dimensions.
+
+    Args:
+        model: Embedding model name, defaults to OLLAMA_EMBEDDING_MODEL
+
+    Returns:
+        Embeddings instance
+    """
+    model = model or config.OLLAMA_EMBEDDING_MODEL
+    with _MODEL_CACHE_LOCK:
+        embedder = _MODEL_CACHE.get(model)
+        if embedder is None:
+            embedder = OllamaEmbeddings(
+                model=model,
+                base_url=config.OLLAMA_BASE_URL,
+                keep_alive=config.OLLAMA_KEEP_ALIVE,
+            )
+            if config.EMBEDDING_DIM:
+                embedder = TruncatedEmbeddings(embedder, config.EMBEDDING_DIM)
+            _MODEL_CACHE[model] = embedder
+        return embedder
+
+
+class FlatIndex:
+    """
+    Exact inner-product index over L2-normalized email embeddings.
+
+    Equivalent to a FAISS IndexFlatIP: every query is scored against every
+    stored vector with one matrix-vector product, which for a few thousand
+    emails is faster than walking an HNSW graph and never misses a neighbour.
+
+    With quantize=True the vectors are kept as symmetric per-row int8 codes,
+    like FAISS IndexScalarQuantizer(QT_8bit). The codes and their float32
+    scales live in separate contiguous arrays so the scoring pass only
+    streams the int8 matrix. Scores are then approximate to within the
+    quantization error.
+    """
+
+    def __init__(self, vectors, documents, metadatas, quantize=False):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+
+        if quantize:
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.codes = np.round(matrix / scales[:, None]).astype(np.int8)
+            self.scales = scales.astype(np.float32)
+            self.matrix = None
+        else:
+            self.codes = None
+            self.scales = None
+            self.matrix = matrix
+
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query_vector, k):
+        """
+        Find the k stored vectors with the highest cosine similarity.
+
+        Args:
+            query_vector: Query embedding
+            k: Number of results to return
+
+        Returns:
+            Tuple of (scores, row indices), best match first
+        """
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        scores = self._scores(q)
+
+        # Select the top k in O(N), then sort only those k
+        k = min(k, len(scores))
+        if k <= 0:
+            return scores[:0], np.empty(0, dtype=np.intp)
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return scores[top], top
+
+    def _scores(self, q):
+        if self.codes is None:
+            return self.matrix @ q
+
+        # NumPy has no int8 BLAS kernel, so widen the codes a block at a time
+        # to keep the float32 temporaries small
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), _SCORE_BLOCK_ROWS):
+            block = self.codes[start : start + _SCORE_BLOCK_ROWS]
+            scores[start : start + len(block)] = block.astype(np.float32) @ q
+        return scores * self.scales
+
+
+def load_flat_index(vectorstore):
+    """
+    Build a FlatIndex from the embeddings already persisted in Chroma.
+
+    If build_vector_store just indexed the whole collection, the index it
+    kept from the freshly computed embeddings is reused instead.
+
+    Args:
+        vectorstore: ChromaDB vector store instance
+
+    Returns:
+        FlatIndex instance, or None if the collection is empty
+    """
+    index = getattr(vectorstore, "_flat_index", None)
+    if index is not None and len(index) == count_documents(vectorstore):
+        return index
+
+    data = vectorstore._collection.get(
+        include=["embeddings", "documents", "metadatas"]
+    )
+    if not data["ids"]:
+        return None
+    return FlatIndex(
+        data["embeddings"],
+        data["documents"],
+        data["metadatas"],
+        quantize=config.FLAT_INDEX_INT8,
+    )
+
+
+def open_vector_store(persist_directory=None, embedding=None):
+    """
+    Open the configured vector store backend, creating the collection if needed.
+
+    Args:
+        persist_directory: Chroma persistence directory (uses config if not provided)
+        embedding: Embeddings used for queries (uses this module's if not provided)
+
+    Returns:
+        Chroma or PGVector vector store instance
+    """
+    embedding = embedding or get_embedder()
+
+    if config.VECTOR_BACKEND == "pgvector":
+        # Optional dependency, only needed for the pgvector backend
+        from langchain_postgres import PGVector
+
+        return PGVector(
+            embeddings=embedding,
+            collection_name=config.CHROMA_COLLECTION_NAME,
+            connection=config.PG_DSN,
+            use_jsonb=True,
+        )
+
+    return Chroma(
+        collection_name=config.CHROMA_COLLECTION_NAME,
+        embedding_function=embedding,
+        persist_directory=persist_directory or config.CHROMA_PERSIST_DIRECTORY,
+        collection_metadata=hnsw_metadata(),
+    )
+
+
+def hnsw_metadata(search_ef=None):
+    """
+    Return the Chroma collection metadata holding the HNSW index parameters.
+
+    Chroma only applies these when the collection is created; an existing
+    collection keeps the parameters it was built with.
+
+    Args:
+        search_ef: Override for CHROMA_HNSW_SEARCH_EF
+
+    Returns:
+        Collection metadata dictionary
+    """
+    return {
+        "hnsw:space": config.CHROMA_HNSW_SPACE,
+        "hnsw:construction_ef": config.CHROMA_HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": search_ef or config.CHROMA_HNSW_SEARCH_EF,
+        "hnsw:M": config.CHROMA_HNSW_M,
+    }
+
+
+def count_documents(vectorstore):
+    """
+    Return the number of documents in the vector store.
+
+    The count is cached on the vector store after the first call, so the CLI
+    and retriever setup share one database round trip. build_vector_store
+    drops the cached value whenever it adds documents.
+
+    Args:
+        vectorstore: Chroma or PGVector vector store instance
+
+    Returns:
+        Document count
+    """
+    cached = vectorstore.__dict__.get("_cached_count")
+    if cached is not None:
+        return cached
+
+    if isinstance(vectorstore, Chroma):
+        count = vectorstore._collection.count()
+    else:
+        with vectorstore._make_sync_session() as session:
+            collection = vectorstore.get_collection(session)
+            if collection is None:
+                count = 0
+            else:
+                count = (
+                    session.query(vectorstore.EmbeddingStore)
+                    .filter(
+                        vectorstore.EmbeddingStore.collection_id == collection.uuid
+                    )
+                    .count()
+                )
+
+    vectorstore.__dict__["_cached_count"] = count
+    return count
+
+
+def _existing_ids(vectorstore, ids):
+    """Return the subset of ids already present in the vector store."""
+    if isinstance(vectorstore, Chroma):
+        found = vectorstore._collection.get(ids=ids, include=[])["ids"]
+    else:
+        found = [doc.id for doc in vectorstore.get_by_ids(ids)]
+    return set(found)
+
+
+def _store_batch(vectorstore, ids, texts, metadatas):
+    """
+    Embed one batch of documents and write it to the vector store.
+
+    Documents are embedded in EMBEDDING_BATCH_SIZE requests and written with
+    a single insert, i.e. one Chroma transaction per batch. Ids must be
+    unique within the batch.
+
+    Returns:
+        List of embedding vectors written
+    """
+    embed_batch_size = config.EMBEDDING_BATCH_SIZE
+    vectors = []
+    for i in range(0, len(texts), embed_batch_size):
+        vectors.extend(get_embedder().embed_documents(texts[i : i + embed_batch_size]))
+
+    # Both backends upsert on id, so re-inserting is idempotent
+    if isinstance(vectorstore, Chroma):
+        # Bypass Chroma's own embedding function
+        vectorstore._collection.upsert(
+            ids=ids, documents=texts, metadatas=metadatas, embeddings=vectors
+        )
+    else:
+        vectorstore.add_embeddings(
+            texts=texts, embeddings=vectors, metadatas=metadatas, ids=ids
+        )
+    return vectors
+
+
+def document_id(email):
+    """
+    Return a stable document id for an email dictionary.
+
+    The id is a BLAKE2b digest of the Message-ID, or of sender, date and
+    subject when the email has none, so re-indexing the same email always
+    maps to the same document.
+    """
+    key = email.get("id") or f"{email['sender']}|{email['date']}|{email['subject']}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
 
 
 def clean_email(email):
@@ -40,14 +359,21 @@ def clean_email(email):
 
 def build_vector_store(email_list, persist_directory=None):
     """
-    Build a ChromaDB vector store from a list of email dictionaries.
+    Build a vector store from a list of email dictionaries.
+
+    Emails carrying an "id" (their Message-ID) that is already stored are
+    skipped, so indexing the same date range again only embeds new mail.
+
+    The backend is chosen by config.VECTOR_BACKEND: ChromaDB on local disk by
+    default, or PostgreSQL/pgvector, whose appends don't rewrite the index.
 
     Args:
         email_list: List of email dictionaries with keys: sender, subject, date, body
+            and optionally id
         persist_directory: Directory to persist the vector store (uses config if not provided)
 
     Returns:
-        ChromaDB vector store instance
+        Chroma or PGVector vector store instance
 
     Raises:
         ValueError: If email_list is empty or invalid
@@ -59,34 +385,83 @@ def build_vector_store(email_list, persist_directory=None):
     persist_dir = persist_directory or config.CHROMA_PERSIST_DIRECTORY
 
     try:
-        cleaned_texts = []
-        metadatas = []
+        # Validate every email up front so errors aren't deferred into workers
+        if not all(all(key in e for key in REQUIRED_EMAIL_KEYS) for e in email_list):
+            raise ValueError(
+                f"Invalid email structure. Required keys: sender, subject, date, body"
+            )
 
+        vectorstore = open_vector_store(persist_dir)
+
+        # The same email can be listed twice, e.g. by overlapping fetches;
+        # keep its first copy since Chroma rejects repeated ids in one call
+        by_id = {}
         for e in email_list:
-            # Validate email structure
-            if not all(key in e for key in ["sender", "subject", "date", "body"]):
-                raise ValueError(
-                    f"Invalid email structure. Required keys: sender, subject, date, body"
+            by_id.setdefault(document_id(e), e)
+        ids = list(by_id)
+        email_list = list(by_id.values())
+
+        # Emails are keyed by Message-ID; skip the ones already indexed so a
+        # re-run only cleans and embeds new mail
+        existing = _existing_ids(vectorstore, ids)
+        if existing:
+            pending = [(i, e) for i, e in zip(ids, email_list) if i not in existing]
+            if not pending:
+                return vectorstore
+            ids = [i for i, _ in pending]
+            email_list = [e for _, e in pending]
+
+        # parse_reply is regex-heavy pure Python and holds the GIL, so large
+        # batches are cleaned across processes rather than threads
+        if len(email_list) >= PARALLEL_CLEAN_THRESHOLD:
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+                cleaned_texts = list(ex.map(clean_email, email_list, chunksize=32))
+        else:
+            cleaned_texts = [clean_email(e) for e in email_list]
+
+        metadatas = [
+            {
+                "sender": e["sender"],
+                "subject": e["subject"],
+                "date": e["date"],
+                "id": i,
+                "message_id": e.get("id", ""),
+            }
+            for i, e in zip(ids, email_list)
+        ]
+
+        # Embed outside of Chroma and insert in fixed-size batches
+        total = len(cleaned_texts)
+        batch_size = config.CHROMA_INSERT_BATCH_SIZE
+        vectors = []
+        for i in range(0, total, batch_size):
+            vectors.extend(
+                _store_batch(
+                    vectorstore,
+                    ids[i : i + batch_size],
+                    cleaned_texts[i : i + batch_size],
+                    metadatas[i : i + batch_size],
                 )
+            )
+            print(f"  ✓ Indexed {min(i + batch_size, total)}/{total} emails")
+
+        # The store has grown, so the next count must go back to the database
+        vectorstore.__dict__.pop("_cached_count", None)
 
-            cleaned = clean_email(e)
-            cleaned_texts.append(cleaned)
-            metadatas.append(
-                {
-                    "sender": e["sender"],
-                    "subject": e["subject"],
-                    "date": e["date"],
-                    "id": str(uuid.uuid4()),
-                }
+        # When this batch is the whole collection, keep it as the in-memory
+        # search index so the query phase needn't read it back from Chroma
+        if (
+            isinstance(vectorstore, Chroma)
+            and total <= config.FLAT_INDEX_MAX_DOCS
+            and count_documents(vectorstore) == total
+        ):
+            vectorstore._flat_index = FlatIndex(
+                vectors, cleaned_texts, metadatas, quantize=config.FLAT_INDEX_INT8
             )
 
-        vectorstore = Chroma.from_texts(
-            texts=cleaned_texts,
-            embedding=embeddings,
-            metadatas=metadatas,
-            collection_name=config.CHROMA_COLLECTION_NAME,
-            persist_directory=persist_dir,
-        )
+        # Cached answers may be stale now that the store has changed
+        query_cache.clear()
+
         return vectorstore
 
     except Exception as e:
@@ -1,29 +1,100 @@
-# Import the fetch_emails tool from agent_email_fetch
-from agent_email_fetch import fetch_emails
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+# Import the async window fetcher from agent_email_fetch
+from agent_email_fetch import fetch_emails_async
 
 # Import vector store building function from agent_email_vector
-from agent_email_vector import build_vector_store
+from agent_email_vector import build_vector_store, count_documents, open_vector_store
 
 # Import configuration
 from config import config
 
+# IMAP sync state is keyed by vector backend and collection, and ignored when
+# that store is empty, so dropping or switching the store forces a full re-fetch
+SYNC_STATE_FILENAME = "sync_state.json"
+
+
+def _sync_state_path():
+    return os.path.join(config.CHROMA_PERSIST_DIRECTORY, SYNC_STATE_FILENAME)
+
+
+def load_sync_state(key):
+    """Return the saved IMAP sync state for key, or None."""
+    try:
+        with open(_sync_state_path(), encoding="utf-8") as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+
+
+def save_sync_state(key, state):
+    """Persist the IMAP sync state for key."""
+    path = _sync_state_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            states = json.load(f)
+    except (OSError, ValueError):
+        states = {}
+
+    states[key] = state
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(states, f, indent=2)
+
+
+def split_date_range(start_date, end_date, days=None):
+    """
+    Split a date range into consecutive windows of at most `days` days.
+
+    IMAP's BEFORE is exclusive, so each window ends where the next one
+    starts and together they cover exactly the original range.
+
+    Args:
+        start_date: Start date (YYYY-MM-DD)
+        end_date: End date (YYYY-MM-DD)
+        days: Window length in days (uses config if not provided)
+
+    Returns:
+        List of (start_date, end_date) tuples
+    """
+    step = timedelta(days=days or config.FETCH_WINDOW_DAYS)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+
+    windows = []
+    while start + step < end:
+        window_end = start + step
+        windows.append((start.strftime("%Y-%m-%d"), window_end.strftime("%Y-%m-%d")))
+        start = window_end
+    windows.append((start.strftime("%Y-%m-%d"), end_date))
+    return windows
+
 
 def run_email_workflow(start_date=None, end_date=None):
     """
     Orchestrates the email workflow:
     1. Fetches emails using the fetch_emails tool
-    2. Builds a ChromaDB vector store from the fetched emails
+    2. Builds a vector store from the fetched emails
     3. Returns the vector store for later use
 
+    The date range is split into FETCH_WINDOW_DAYS windows that are fetched
+    concurrently over pooled IMAP connections. Repeated runs over the same
+    range are incremental: the IMAP sync state saved per window after each
+    successful run limits the fetch to emails that changed since then.
+
     Args:
         start_date: Optional start date (YYYY-MM-DD), uses config if not provided
         end_date: Optional end date (YYYY-MM-DD), uses config if not provided
 
     Returns:
-        ChromaDB vector store instance or None if no emails found
+        Tuple of (vector store instance, number of documents indexed), or
+        (None, 0) if no emails found
 
     Raises:
-        ValueError: If configuration is invalid
+        ValueError: If configuration or a date is invalid
         Exception: If email fetching or vector store creation fails
     """
     try:
@@ -33,6 +104,11 @@ def run_email_workflow(start_date=None, end_date=None):
         # Use provided dates or fall back to config
         start = start_date or config.START_DATE
         end = end_date or config.END_DATE
+        for name, value in (("start", start), ("end", end)):
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Invalid {name} date '{value}'. Use YYYY-MM-DD")
         print("=" * 50)
         print("EMAIL ASSISTANT - WORKFLOW")
         print("=" * 50)
@@ -42,41 +118,63 @@ def run_email_workflow(start_date=None, end_date=None):
 
         print("Step 1: Fetching emails...")
 
-        # Directly invoke the fetch_emails tool
-        # No need for agent pattern since we're just calling one tool directly
-        result = fetch_emails.invoke(
-            {
-                "email_id": config.EMAIL_ID,
-                "app_password": config.APP_PASSWORD,
-                "start_date": start,
-                "end_date": end,
-            }
+        windows = split_date_range(start, end)
+        store_key = f"{config.VECTOR_BACKEND}|{config.CHROMA_COLLECTION_NAME}"
+        sync_keys = [
+            f"{store_key}|{config.EMAIL_ID}|INBOX|{ws}|{we}" for ws, we in windows
+        ]
+        previous_states = [load_sync_state(key) for key in sync_keys]
+        if any(state is not None for state in previous_states):
+            # Saved progress is stale if the store was emptied since
+            if count_documents(open_vector_store()) == 0:
+                previous_states = [None] * len(windows)
+
+        # Fetch every window concurrently, each over its own IMAP connection
+        result = asyncio.run(
+            fetch_emails_async(
+                config.EMAIL_ID,
+                config.APP_PASSWORD,
+                windows,
+                previous_states,
+            )
         )
 
         # Extract email list from result
         email_list = result.get("emails", [])
+        sync_states = result.get("sync_states", [])
 
         if not email_list:
+            if any(state is not None for state in previous_states):
+                # Incremental sync: the existing store is already up to date
+                print("✓ No new emails since the last sync")
+                vectorstore = open_vector_store()
+                return vectorstore, count_documents(vectorstore)
             print("⚠ No emails found in the specified date range")
-            return None
+            return None, 0
 
-        print(f"✓ Fetched {len(email_list)} emails")
+        print(f"✓ Fetched {len(email_list)} emails ({len(windows)} date windows)")
 
         # email_list is already a list of dictionaries from the tool
         email_dicts = email_list
 
-        print("\nStep 2: Building ChromaDB vector store...")
+        print("\nStep 2: Building vector store...")
 
         # Build the vector store from the emails
         vectorstore = build_vector_store(email_dicts)
 
+        # Only record progress once the emails are safely indexed
+        for key, state in zip(sync_keys, sync_states):
+            if state:
+                save_sync_state(key, state)
+
+        n_indexed = count_documents(vectorstore)
         print(f"✓ Vector store created successfully")
-        print(f"✓ Total documents in vector store: {vectorstore._collection.count()}")
+        print(f"✓ Total documents in vector store: {n_indexed}")
 
-        return vectorstore
+        return vectorstore, n_indexed
 
-    except ValueError as e:
-        print(f"\n❌ Configuration Error: {e}")
+    except ValueError:
+        # Callers report configuration errors, with a hint about .env
         raise
     except Exception as e:
         print(f"\n❌ Workflow Error: {e}")
@@ -86,7 +184,7 @@ def run_email_workflow(start_date=None, end_date=None):
 if __name__ == "__main__":
     try:
         # Run the workflow
-        vectorstore = run_email_workflow()
+        vectorstore, _ = run_email_workflow()
 
         if vectorstore:
             print("\n" + "=" * 50)
@@ -9,7 +9,15 @@ load_dotenv()
 
 
 class Config:
-    """Application configuration loaded from environment variables."""
+    """
+    Application configuration loaded from environment variables.
+
+    The embedding model is independent of the LLM: a dedicated embedding
+    model (nomic-embed-text, 768-d) embeds far faster and yields much smaller
+    vectors than reusing the chat LLM (llama3.1:8b, 4096-d). Changing it
+    requires rebuilding the vector store, since vectors of different models
+    and dimensions cannot be mixed.
+    """
 
     # Email Configuration
     EMAIL_ID = os.getenv("EMAIL_ID", "")
@@ -19,20 +27,57 @@ class Config:
     START_DATE = os.getenv("START_DATE", "2025-11-28")
     END_DATE = os.getenv("END_DATE", "2025-11-30")
 
+    # IMAP Configuration
+    IMAP_MAX_CONNECTIONS = int(os.getenv("IMAP_MAX_CONNECTIONS", "4"))
+    # Date ranges are fetched as concurrent windows of this many days
+    FETCH_WINDOW_DAYS = int(os.getenv("FETCH_WINDOW_DAYS", "7"))
+
     # Ollama Configuration
     OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "llama3.1:8b")
-    OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "llama3.1:8b")
+    OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    # Keep only the first N embedding dimensions (0 keeps the model's full size)
+    EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "0"))
+    OLLAMA_KEEP_ALIVE = int(os.getenv("OLLAMA_KEEP_ALIVE", "1800"))
 
     # Vector Store Configuration
+    # "chroma" (local, default) or "pgvector" (PostgreSQL via langchain-postgres)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+    PG_DSN = os.getenv("PG_DSN", "")
     CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "chroma_store")
     CHROMA_COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME", "emails")
+    CHROMA_INSERT_BATCH_SIZE = int(os.getenv("CHROMA_INSERT_BATCH_SIZE", "500"))
+    # HNSW index parameters, applied when the Chroma collection is created
+    # (scripts/tune_hnsw.py sweeps search_ef against exact search)
+    CHROMA_HNSW_SPACE = os.getenv("CHROMA_HNSW_SPACE", "cosine")
+    CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", "200"))
+    CHROMA_HNSW_SEARCH_EF = int(os.getenv("CHROMA_HNSW_SEARCH_EF", "100"))
+    CHROMA_HNSW_M = int(os.getenv("CHROMA_HNSW_M", "16"))
 
     # LLM Configuration
     LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.2"))
 
     # Query Configuration
     DEFAULT_RETRIEVAL_COUNT = int(os.getenv("DEFAULT_RETRIEVAL_COUNT", "50"))
+    # Collections up to this size are searched exactly in memory (0 disables)
+    FLAT_INDEX_MAX_DOCS = int(os.getenv("FLAT_INDEX_MAX_DOCS", "10000"))
+    # Store the in-memory index as int8 codes (4x smaller than float32)
+    FLAT_INDEX_INT8 = os.getenv("FLAT_INDEX_INT8", "true").lower() == "true"
+    # Optional cross-encoder that reranks the retrieved emails (empty disables)
+    RERANKER_MODEL = os.getenv("RERANKER_MODEL", "")
+    RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))
+
+    # Conversation Memory Configuration (one file per backend, collection and
+    # account, so switching mailboxes never resumes another's conversation)
+    CHAT_HISTORY_DIR = os.getenv("CHAT_HISTORY_DIR", "~/.email_assistant/chat_history")
+    CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "10"))
+
+    # Query Cache Configuration
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+    QUERY_CACHE_THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.95"))
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1000"))
 
     @classmethod
     def validate(cls):
@@ -47,6 +92,10 @@ class Config:
             errors.append("OLLAMA_BASE_URL is required")
         if not cls.OLLAMA_LLM_MODEL:
             errors.append("OLLAMA_LLM_MODEL is required")
+        if cls.VECTOR_BACKEND not in ("chroma", "pgvector"):
+            errors.append("VECTOR_BACKEND must be 'chroma' or 'pgvector'")
+        if cls.VECTOR_BACKEND == "pgvector" and not cls.PG_DSN:
+            errors.append("PG_DSN is required when VECTOR_BACKEND is 'pgvector'")
 
         if errors:
             raise ValueError(
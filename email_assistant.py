@@ -7,78 +7,211 @@ It orchestrates the complete workflow: fetch → vector store → query
 """
 
 import sys
-import argparse
+import functools
 import os
-from datetime import datetime
+import re
+from types import SimpleNamespace
 
 from config import config
-from agent_email_workflow import run_email_workflow
-from agent_email_query import (
-    load_vector_store,
-    create_conversational_query_chain,
-    query_emails,
+
+# The agent_email_* modules pull in LangChain, Chroma and the IMAP client, so
+# they are imported inside the commands that need them rather than here.
+
+
+@functools.cache
+def _lazy_query_mod():
+    """Import agent_email_query on first use and return the module."""
+    import agent_email_query
+
+    return agent_email_query
+
+
+# Interactive prompt history, kept across sessions
+HISTORY_FILE = os.path.expanduser("~/.email_assistant_history")
+
+EXAMPLE_QUERIES = [
+    "How many emails did I receive?",
+    "Who sent the email about the project deadline?",
+    "What was the subject of the email from that sender?",
+    "List all senders",
+]
+
+# Output fragments built once at import and written with a single call
+_SEP = "=" * 60
+_DASH = "-" * 60
+_BANNER = f"\n{_SEP}\n           EMAIL ASSISTANT - AI-Powered Email Query\n{_SEP}\n\n"
+_PROMPT = "Ask a question about your emails (or 'quit' to exit): "
+_EXAMPLES = (
+    "Example queries you can try:\n"
+    + "\n".join(f"  {i}. {q}" for i, q in enumerate(EXAMPLE_QUERIES, 1))
+    + f"\n\n{_SEP}\n\n"
 )
+_ANSWER_HEADER = "\nSearching and generating response...\n\nAnswer: "
+_ANSWER_FOOTER = f"\n\n{_DASH}\n\n"
 
 
 def print_banner():
     """Print application banner."""
-    print("\n" + "=" * 60)
-    print("           EMAIL ASSISTANT - AI-Powered Email Query")
-    print("=" * 60 + "\n")
+    sys.stdout.write(_BANNER)
+
+
+def _try_fast_path(question, vectorstore, qa_chain):
+    """
+    Answer metadata-only questions (counts, senders) without the LLM.
+
+    The exchange is still added to the chain's memory so follow-up questions
+    can refer to it.
+
+    Returns:
+        Answer string, or None if the question needs the full chain
+    """
+    answer = _lazy_query_mod().answer_from_metadata(vectorstore, question)
+    if answer is not None:
+        qa_chain.memory.save_context({"question": question}, {"answer": answer})
+    return answer
+
+
+def _interactive_loop(qa_chain, vectorstore, use_cache=True):
+    """
+    Answer questions typed by the user until they quit.
+
+    On a terminal the prompt supports line editing and keeps a history in
+    HISTORY_FILE; piped input is read with plain input().
+
+    Args:
+        qa_chain: The ConversationalRetrievalChain instance
+        vectorstore: Vector store behind the chain, for metadata-only answers
+        use_cache: Whether to reuse cached answers
+    """
+    query_mod = _lazy_query_mod()
+
+    if sys.stdin.isatty():
+        from prompt_toolkit import PromptSession
+        from prompt_toolkit.history import FileHistory
+
+        read_question = PromptSession(history=FileHistory(HISTORY_FILE)).prompt
+    else:
+        read_question = input
+
+    sys.stdout.write(_EXAMPLES)
+
+    while True:
+        try:
+            user_input = read_question(_PROMPT).strip()
+
+            if user_input.lower() in ["quit", "exit", "q"]:
+                print("\nGoodbye!\n")
+                break
+
+            if not user_input:
+                continue
+
+            answer = _try_fast_path(user_input, vectorstore, qa_chain)
+            if answer is not None:
+                sys.stdout.write(f"\nAnswer: {answer}{_ANSWER_FOOTER}")
+                sys.stdout.flush()
+                continue
+
+            sys.stdout.write(_ANSWER_HEADER)
+            sys.stdout.flush()
+            # Stream the answer so it appears as soon as the LLM starts
+            query_mod.query_emails(qa_chain, user_input, use_cache, stream=True)
+            sys.stdout.write(_ANSWER_FOOTER)
+            sys.stdout.flush()
+
+        except (KeyboardInterrupt, EOFError):
+            print("\n\nGoodbye!\n")
+            break
+        except Exception as e:
+            sys.stdout.write(f"❌ Error: {e}\n{_ANSWER_FOOTER}")
+            sys.stdout.flush()
+
+    # Keep only the recent conversation for the next session
+    query_mod.trim_chat_history(qa_chain)
 
 
 def check_vector_store_exists():
     """Check if vector store exists."""
+    if config.VECTOR_BACKEND == "pgvector":
+        # The collection lives in PostgreSQL; loading it reports any problem
+        return True
     return os.path.exists(config.CHROMA_PERSIST_DIRECTORY) and os.path.isdir(
         config.CHROMA_PERSIST_DIRECTORY
     )
 
 
-def get_vector_store_info():
-    """Get information about the existing vector store."""
+def load_if_exists():
+    """
+    Load the existing vector store together with its document count.
+
+    Returns:
+        Tuple of (vectorstore, count), or (None, 0) if no store exists
+
+    Raises:
+        Exception: If the store exists but cannot be loaded
+    """
+    if not check_vector_store_exists():
+        return None, 0
+    from agent_email_vector import count_documents
+
+    vectorstore = _lazy_query_mod().load_vector_store()
+    return vectorstore, count_documents(vectorstore)
+
+
+def _config_status():
+    """Validate the configuration; return (is_valid, status text)."""
+    try:
+        config.validate()
+    except ValueError as e:
+        return False, f"✗ Configuration: Invalid\n  Error: {e}\n"
+    return True, (
+        "✓ Configuration: Valid\n"
+        f"  - Email: {config.EMAIL_ID}\n"
+        f"  - Date Range: {config.START_DATE} to {config.END_DATE}\n"
+    )
+
+
+def _vector_store_status():
+    """Load the vector store and return its status text."""
     try:
-        vectorstore = load_vector_store()
-        count = vectorstore._collection.count()
-        return count
-    except Exception as e:
-        return None
+        vectorstore, count = load_if_exists()
+    except Exception:
+        return "✗ Vector Store: Error loading\n"
+
+    if vectorstore is None:
+        return (
+            "✗ Vector Store: Not found\n"
+            "  Run 'python email_assistant.py refresh' to fetch and index emails\n"
+        )
+
+    lines = ["✓ Vector Store: Ready", f"  - Backend: {config.VECTOR_BACKEND}"]
+    if config.VECTOR_BACKEND == "chroma":
+        lines.append(f"  - Location: {config.CHROMA_PERSIST_DIRECTORY}")
+    lines.append(f"  - Total Emails: {count}")
+    return "\n".join(lines) + "\n"
 
 
 def cmd_status():
     """Display status of the email assistant system."""
     print_banner()
     print("System Status:")
-    print("-" * 60)
+    print(_DASH)
 
-    # Check configuration
-    try:
-        config.validate()
-        print("✓ Configuration: Valid")
-        print(f"  - Email: {config.EMAIL_ID}")
-        print(f"  - Date Range: {config.START_DATE} to {config.END_DATE}")
-    except ValueError as e:
-        print(f"✗ Configuration: Invalid")
-        print(f"  Error: {e}")
+    # Validation only inspects a few settings; the store is loaded only once
+    # the configuration is known to be usable
+    config_ok, config_text = _config_status()
+    sys.stdout.write(config_text)
+    if not config_ok:
         return
+    sys.stdout.write(_vector_store_status())
 
-    # Check vector store
-    if check_vector_store_exists():
-        count = get_vector_store_info()
-        if count is not None:
-            print(f"✓ Vector Store: Ready")
-            print(f"  - Location: {config.CHROMA_PERSIST_DIRECTORY}")
-            print(f"  - Total Emails: {count}")
-        else:
-            print(f"✗ Vector Store: Error loading")
-    else:
-        print(f"✗ Vector Store: Not found")
-        print(f"  Run 'python email_assistant.py refresh' to fetch and index emails")
-
-    print("-" * 60 + "\n")
+    print(_DASH + "\n")
 
 
 def cmd_refresh(start_date=None, end_date=None):
     """Fetch fresh emails and rebuild vector store."""
+    from agent_email_workflow import run_email_workflow
+
     print_banner()
 
     try:
@@ -86,20 +219,20 @@ def cmd_refresh(start_date=None, end_date=None):
         config.validate()
 
         # Run the workflow
-        vectorstore = run_email_workflow(start_date, end_date)
+        vectorstore, n_indexed = run_email_workflow(start_date, end_date)
 
         if vectorstore:
-            print("\n" + "=" * 60)
+            print("\n" + _SEP)
             print("✓ Email refresh completed successfully!")
-            print(f"✓ Total emails indexed: {vectorstore._collection.count()}")
-            print("=" * 60 + "\n")
+            print(f"✓ Total emails indexed: {n_indexed}")
+            print(_SEP + "\n")
             print("You can now query your emails using:")
             print("  python email_assistant.py query")
             print()
         else:
-            print("\n" + "=" * 60)
+            print("\n" + _SEP)
             print("⚠ No emails found in the specified date range")
-            print("=" * 60 + "\n")
+            print(_SEP + "\n")
 
     except ValueError as e:
         print(f"\n❌ Configuration Error: {e}\n")
@@ -110,26 +243,27 @@ def cmd_refresh(start_date=None, end_date=None):
         sys.exit(1)
 
 
-def cmd_query(interactive=True, question=None):
+def cmd_query(interactive=True, question=None, use_cache=True):
     """Query the email vector store."""
+    query_mod = _lazy_query_mod()
     print_banner()
 
     try:
-        # Check if vector store exists
-        if not check_vector_store_exists():
+        # Load the vector store
+        print("Loading vector store...")
+        vectorstore, count = load_if_exists()
+        if vectorstore is None:
             print("❌ Vector store not found!\n")
             print("Please run the following command first:")
             print("  python email_assistant.py refresh\n")
             sys.exit(1)
-
-        # Load the vector store
-        print("Loading vector store...")
-        vectorstore = load_vector_store()
-        count = vectorstore._collection.count()
         print(f"✓ Loaded {count} emails")
         
-        # NEW: Create the conversational chain
-        qa_chain = create_conversational_query_chain(vectorstore)
+        # NEW: Create the conversational chain; a single question doesn't
+        # read or extend the saved conversation
+        qa_chain = query_mod.create_conversational_query_chain(
+            vectorstore, persist_history=interactive
+        )
         print("✓ Initialized conversational chain\n")
 
 
@@ -137,54 +271,19 @@ def cmd_query(interactive=True, question=None):
             # Single query mode
             print(f"Question: {question}\n")
             print("Searching and generating response...\n")
-            response = query_emails(qa_chain, question)
+            response = _try_fast_path(question, vectorstore, qa_chain)
+            if response is None:
+                response = query_mod.query_emails(qa_chain, question, use_cache)
             print(f"Answer: {response}\n")
             return
 
         # Interactive mode
-        print("=" * 60)
+        print(_SEP)
         print("INTERACTIVE QUERY MODE (with conversational memory)")
-        print("=" * 60)
-
-        # Example queries
-        example_queries = [
-            "How many emails did I receive?",
-            "Who sent the email about the project deadline?",
-            "What was the subject of the email from that sender?", 
-            "List all senders",
-        ]
-
-        print("\nExample queries you can try:")
-        for i, q in enumerate(example_queries, 1):
-            print(f"  {i}. {q}")
-
-        print("\n" + "=" * 60 + "\n")
-
-        # Interactive query loop
-        while True:
-            try:
-                user_input = input(
-                    "Ask a question about your emails (or 'quit' to exit): "
-                ).strip()
-
-                if user_input.lower() in ["quit", "exit", "q"]:
-                    print("\nGoodbye!\n")
-                    break
-
-                if not user_input:
-                    continue
-
-                print("\nSearching and generating response...\n")
-                response = query_emails(qa_chain, user_input)
-                print(f"Answer: {response}\n")
-                print("-" * 60 + "\n")
-
-            except KeyboardInterrupt:
-                print("\n\nGoodbye!\n")
-                break
-            except Exception as e:
-                print(f"❌ Error: {e}\n")
-                print("-" * 60 + "\n")
+        print(_SEP)
+
+        print()
+        _interactive_loop(qa_chain, vectorstore, use_cache)
 
     except FileNotFoundError as e:
         print(f"\n❌ {e}\n")
@@ -194,71 +293,35 @@ def cmd_query(interactive=True, question=None):
         sys.exit(1)
 
 
-def cmd_workflow():
+def cmd_workflow(use_cache=True):
     """Run the complete workflow: fetch → vector → query."""
+    from agent_email_workflow import run_email_workflow
+
+    query_mod = _lazy_query_mod()
     print_banner()
     print("Running complete workflow: Fetch → Index → Query\n")
 
     try:
         # Step 1: Fetch and index emails
         print("Phase 1: Fetching and indexing emails")
-        print("-" * 60)
-        vectorstore = run_email_workflow()
+        print(_DASH)
+        vectorstore, count = run_email_workflow()
 
         if not vectorstore:
             print("\n⚠ No emails found. Cannot proceed to query phase.\n")
             sys.exit(0)
 
-        print("\n" + "=" * 60)
+        print("\n" + _SEP)
         print("Phase 2: Interactive Query Mode")
-        print("=" * 60 + "\n")
+        print(_SEP + "\n")
         
-        qa_chain = create_conversational_query_chain(vectorstore)
+        qa_chain = query_mod.create_conversational_query_chain(vectorstore)
 
 
         # Step 2: Query mode
-        count = vectorstore._collection.count()
         print(f"✓ Ready to query {count} emails (with memory)\n")
 
-        # Example queries
-        example_queries = [
-            "How many emails did I receive?",
-            "Who sent the email about the project deadline?",
-            "What was the subject of the email from that sender?",
-            "List all senders",
-        ]
-
-        print("Example queries you can try:")
-        for i, q in enumerate(example_queries, 1):
-            print(f"  {i}. {q}")
-
-        print("\n" + "=" * 60 + "\n")
-
-        # Interactive query loop
-        while True:
-            try:
-                user_input = input(
-                    "Ask a question about your emails (or 'quit' to exit): "
-                ).strip()
-
-                if user_input.lower() in ["quit", "exit", "q"]:
-                    print("\nGoodbye!\n")
-                    break
-
-                if not user_input:
-                    continue
-
-                print("\nSearching and generating response...\n")
-                response = query_emails(qa_chain, user_input)
-                print(f"Answer: {response}\n")
-                print("-" * 60 + "\n")
-
-            except KeyboardInterrupt:
-                print("\n\nGoodbye!\n")
-                break
-            except Exception as e:
-                print(f"❌ Error: {e}\n")
-                print("-" * 60 + "\n")
+        _interactive_loop(qa_chain, vectorstore, use_cache)
 
     except ValueError as e:
         print(f"\n❌ Configuration Error: {e}\n")
@@ -269,8 +332,87 @@ def cmd_workflow():
         sys.exit(1)
 
 
-def main():
-    """Main entry point for the Email Assistant CLI."""
+def _configure_performance_environment():
+    """
+    Set thread and logging defaults for the native libraries used later.
+
+    Must run before NumPy, PyTorch or tokenizers are imported, since they read
+    these variables once at import. Values already set in the environment win.
+    """
+    threads = str(max(1, (os.cpu_count() or 2) // 2))
+    os.environ.setdefault("OMP_NUM_THREADS", threads)
+    os.environ.setdefault("MKL_NUM_THREADS", threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    os.environ.setdefault("TRANSFORMERS_NO_ADVISORY_WARNINGS", "1")
+
+
+COMMANDS = ("status", "refresh", "query", "workflow")
+
+# CLI dates are checked by hand so datetime is never imported here
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _is_valid_date(value):
+    """Return whether value is a real calendar date written as YYYY-MM-DD."""
+    if not _DATE_RE.fullmatch(value):
+        return False
+    year, month, day = map(int, value.split("-"))
+    if year < 1 or not 1 <= month <= 12:
+        return False
+    leap = month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    return 1 <= day <= _DAYS_IN_MONTH[month - 1] + leap
+
+# Command-line options, keyed by spelling, mapped to their argument name
+_VALUE_OPTIONS = {
+    "--start": "start",
+    "--end": "end",
+    "--question": "question",
+    "-q": "question",
+}
+_FLAG_OPTIONS = {"--no-cache": "no_cache"}
+
+
+def _parse_args_fast(argv):
+    """
+    Parse a well-formed command line without building the argparse parser.
+
+    Args:
+        argv: Command-line arguments without the program name
+
+    Returns:
+        Namespace with command, start, end, question and no_cache, or None if
+        argv needs argparse (help, errors or unusual syntax)
+    """
+    if not argv or argv[0] not in COMMANDS:
+        return None
+
+    args = {
+        "command": argv[0],
+        "start": None,
+        "end": None,
+        "question": None,
+        "no_cache": False,
+    }
+    tokens = iter(argv[1:])
+    for token in tokens:
+        option, sep, value = token.partition("=")
+        if token in _FLAG_OPTIONS:
+            args[_FLAG_OPTIONS[token]] = True
+        elif option in _VALUE_OPTIONS:
+            value = value if sep else next(tokens, None)
+            if value is None or value.startswith("-"):
+                return None
+            args[_VALUE_OPTIONS[option]] = value
+        else:
+            return None
+    return SimpleNamespace(**args)
+
+
+def _build_parser():
+    """Build the full argparse parser, used for --help and error reporting."""
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Email Assistant - AI-Powered Email Query System",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -291,6 +433,9 @@ Examples:
   # Query with a single question (no memory)
   python email_assistant.py query --question "Summarize my emails"
 
+  # Answer repeated questions with the LLM instead of the session cache
+  python email_assistant.py query --no-cache
+
   # Run complete workflow (fetch + query)
   python email_assistant.py workflow
         """,
@@ -298,7 +443,7 @@ Examples:
 
     parser.add_argument(
         "command",
-        choices=["status", "refresh", "query", "workflow"],
+        choices=COMMANDS,
         help="Command to execute",
     )
 
@@ -321,21 +466,30 @@ Examples:
         help="Single question to ask (non-interactive mode)",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Answer every question with the LLM instead of reusing answers to"
+            " questions already asked in this session"
+        ),
+    )
 
-    # Validate date format if provided
-    if args.start:
-        try:
-            datetime.strptime(args.start, "%Y-%m-%d")
-        except ValueError:
-            print("❌ Invalid start date format. Use YYYY-MM-DD\n")
-            sys.exit(1)
+    return parser
 
-    if args.end:
-        try:
-            datetime.strptime(args.end, "%Y-%m-%d")
-        except ValueError:
-            print("❌ Invalid end date format. Use YYYY-MM-DD\n")
+
+def main():
+    """Main entry point for the Email Assistant CLI."""
+    _configure_performance_environment()
+
+    # The common invocations are parsed by hand; argparse is only built for
+    # --help and malformed command lines
+    args = _parse_args_fast(sys.argv[1:]) or _build_parser().parse_args()
+
+    # Reject bad dates here, as argument errors, before any command runs
+    for name, value in (("start", args.start), ("end", args.end)):
+        if value and not _is_valid_date(value):
+            print(f"❌ Invalid {name} date '{value}'. Use YYYY-MM-DD\n")
             sys.exit(1)
 
     # Execute command
@@ -344,9 +498,13 @@ Examples:
     elif args.command == "refresh":
         cmd_refresh(args.start, args.end)
     elif args.command == "query":
-        cmd_query(interactive=(not args.question), question=args.question)
+        cmd_query(
+            interactive=(not args.question),
+            question=args.question,
+            use_cache=not args.no_cache,
+        )
     elif args.command == "workflow":
-        cmd_workflow()
+        cmd_workflow(use_cache=not args.no_cache)
 
 
 if __name__ == "__main__":
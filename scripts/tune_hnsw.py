@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+HNSW tuning harness for the email vector store.
+
+Copies the embeddings of the existing Chroma collection into throwaway
+in-memory collections and sweeps one HNSW parameter (search_ef) while the
+others stay at their configured values. For each setting it reports p50/p99
+query latency and recall@k against exact cosine search, so the fastest
+search_ef that keeps recall acceptable can be written to CHROMA_HNSW_SEARCH_EF.
+
+Usage:
+    python scripts/tune_hnsw.py
+    python scripts/tune_hnsw.py --search-ef 50 100 200 400 --queries 200 -k 10
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import chromadb
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config
+from agent_email_vector import hnsw_metadata, open_vector_store
+
+
+def exact_neighbors(matrix, queries, k):
+    """Return the row indices of the exact top-k cosine neighbours per query."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    unit = matrix / np.where(norms == 0, 1, norms)
+    scores = queries @ unit.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def measure(matrix, queries, truth, k, search_ef, batch_size):
+    """
+    Build an HNSW collection with the given search_ef and time its queries.
+
+    Returns:
+        Tuple of (p50 latency ms, p99 latency ms, recall@k)
+    """
+    client = chromadb.EphemeralClient()
+    name = f"tune_hnsw_{search_ef}"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    collection = client.create_collection(
+        name, metadata=hnsw_metadata(search_ef=search_ef)
+    )
+
+    ids = [str(i) for i in range(len(matrix))]
+    for i in range(0, len(matrix), batch_size):
+        collection.add(
+            ids=ids[i : i + batch_size],
+            embeddings=matrix[i : i + batch_size].tolist(),
+        )
+
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {int(i) for i in result["ids"][0]}
+        hits += len(found.intersection(expected.tolist()))
+
+    client.delete_collection(name)
+    return (
+        float(np.percentile(latencies, 50)),
+        float(np.percentile(latencies, 99)),
+        hits / (len(queries) * k),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep Chroma HNSW search_ef")
+    parser.add_argument(
+        "--search-ef",
+        type=int,
+        nargs="+",
+        default=[50, 100, 200, 400],
+        help="search_ef values to try",
+    )
+    parser.add_argument(
+        "--queries", type=int, default=200, help="Number of sampled queries"
+    )
+    parser.add_argument("-k", type=int, default=10, help="Neighbours per query")
+    args = parser.parse_args()
+
+    print("Loading embeddings from the vector store...")
+    vectorstore = open_vector_store()
+    data = vectorstore._collection.get(include=["embeddings"])
+    if not data["ids"]:
+        print("❌ Vector store is empty. Run 'python email_assistant.py refresh' first.")
+        sys.exit(1)
+
+    matrix = np.asarray(data["embeddings"], dtype=np.float32)
+    k = min(args.k, len(matrix))
+
+    # Stored emails, lightly perturbed, stand in for query embeddings
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(matrix), size=min(args.queries, len(matrix)), replace=False)
+    queries = matrix[rows] / np.linalg.norm(matrix[rows], axis=1, keepdims=True)
+    queries = queries + rng.normal(0, 0.01, size=queries.shape)
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(
+        np.float32
+    )
+    truth = exact_neighbors(matrix, queries, k)
+
+    print(f"✓ {len(matrix)} vectors, {len(queries)} queries, recall@{k}")
+    print(
+        f"  construction_ef={config.CHROMA_HNSW_CONSTRUCTION_EF}"
+        f" M={config.CHROMA_HNSW_M} space={config.CHROMA_HNSW_SPACE}\n"
+    )
+    print(f"{'search_ef':>10} {'p50 ms':>10} {'p99 ms':>10} {'recall':>10}")
+    print("-" * 43)
+    for search_ef in args.search_ef:
+        p50, p99, recall = measure(
+            matrix, queries, truth, k, search_ef, config.CHROMA_INSERT_BATCH_SIZE
+        )
+        print(f"{search_ef:>10} {p50:>10.2f} {p99:>10.2f} {recall:>10.3f}")
+
+    print("\nSet CHROMA_HNSW_SEARCH_EF in .env to the chosen value and rebuild the store.")
+
+
+if __name__ == "__main__":
+    main()
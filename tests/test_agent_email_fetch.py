@@ -0,0 +1,260 @@
+"""
+Tests for the IMAP FETCH and BODYSTRUCTURE parsing in agent_email_fetch.
+
+The response lists below have the shape imaplib returns from ``imap.uid``:
+a line ending in a ``{n}`` literal marker arrives as a (line, literal) tuple,
+and the rest of the line follows as the next item.
+"""
+
+import unittest
+
+from agent_email_fetch import (
+    _CLOSE,
+    _OPEN,
+    _fetch_window,
+    _find_text_part,
+    _get_item,
+    _is_attachment,
+    _nest,
+    _parse_fetch_response,
+    _tokenize,
+)
+
+HEADER_ITEM = b"BODY[HEADER.FIELDS (FROM SUBJECT DATE MESSAGE-ID CONTENT-TYPE)]"
+
+PLAIN = b'("TEXT" "PLAIN" ("CHARSET" "iso-8859-1") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL NIL)'
+HTML = b'("TEXT" "HTML" ("CHARSET" "utf-8") NIL NIL "7BIT" 300 8 NIL NIL NIL NIL)'
+PDF = (
+    b'("APPLICATION" "PDF" ("NAME" "report.pdf") NIL NIL "BASE64" 5000 NIL'
+    b' ("ATTACHMENT" ("FILENAME" "report.pdf")) NIL NIL)'
+)
+PLAIN_ATTACHMENT = (
+    b'("TEXT" "PLAIN" ("CHARSET" "us-ascii" "NAME" "notes.txt") NIL NIL "BASE64"'
+    b' 80 2 NIL ("ATTACHMENT" ("FILENAME" "notes.txt")) NIL NIL)'
+)
+
+
+def _headers(n):
+    return (
+        f"From: Sender {n} <s{n}@example.com>\r\n"
+        f"Subject: Message {n}\r\n"
+        f"Date: Mon, 3 Nov 2025 10:0{n}:00 +0000\r\n"
+        f"Message-ID: <{n}@example.com>\r\n\r\n"
+    ).encode()
+
+
+def _first_pass(num, uid, structure):
+    """Build the imaplib pieces of one header + BODYSTRUCTURE FETCH response."""
+    header = _headers(num)
+    return [
+        (
+            b"%d (UID %d BODYSTRUCTURE %s %s {%d}"
+            % (num, uid, structure, HEADER_ITEM, len(header)),
+            header,
+        ),
+        b")",
+    ]
+
+
+def _structure(raw):
+    """Parse a BODYSTRUCTURE the way _fetch_window receives it."""
+    [(_, items)] = _parse_fetch_response([b"1 (UID 1 BODYSTRUCTURE " + raw + b")"])
+    return items["BODYSTRUCTURE"]
+
+
+class TokenizeTests(unittest.TestCase):
+    def test_quoted_strings_nil_and_literals(self):
+        tokens = _tokenize(
+            [(b'1 (X "a \\"b\\"" NIL {3}', b"abc"), b" Y)"]
+        )
+        self.assertEqual(
+            tokens, [b"1", _OPEN, b"X", b'a "b"', None, b"abc", b"Y", _CLOSE]
+        )
+
+    def test_section_spec_stays_one_atom(self):
+        tokens = _tokenize([b"1 (BODY[HEADER.FIELDS (FROM DATE)] NIL)"])
+        self.assertEqual(
+            tokens,
+            [b"1", _OPEN, b"BODY[HEADER.FIELDS (FROM DATE)]", None, _CLOSE],
+        )
+
+    def test_nest_closes_unbalanced_parens(self):
+        self.assertEqual(
+            _nest([b"1", _OPEN, b"A", _OPEN, b"B"]), [b"1", [b"A", [b"B"]]]
+        )
+
+
+class ParseFetchResponseTests(unittest.TestCase):
+    def test_uid_before_body(self):
+        data = [(b"1 (UID 11 BODY[1] {5}", b"hello"), b")"]
+        [(num, items)] = _parse_fetch_response(data)
+        self.assertEqual(num, b"1")
+        self.assertEqual(items["UID"], b"11")
+        self.assertEqual(items["BODY[1]"], b"hello")
+
+    def test_uid_after_body(self):
+        data = [(b"1 (BODY[1] {5}", b"hello"), b" UID 11)"]
+        [(_, items)] = _parse_fetch_response(data)
+        self.assertEqual(items["UID"], b"11")
+        self.assertEqual(items["BODY[1]"], b"hello")
+
+    def test_several_messages_in_one_response(self):
+        data = _first_pass(1, 11, PLAIN) + _first_pass(2, 12, HTML)
+        messages = _parse_fetch_response(data)
+        self.assertEqual([items["UID"] for _, items in messages], [b"11", b"12"])
+        self.assertEqual(_get_item(messages[1][1], "BODY[HEADER"), _headers(2))
+
+    def test_unsolicited_fetch_without_uid(self):
+        # Flag updates for other messages can arrive mid-response
+        data = (
+            _first_pass(1, 11, PLAIN)
+            + [b"7 (FLAGS (\\Seen))"]
+            + _first_pass(2, 12, PLAIN)
+        )
+        messages = _parse_fetch_response(data)
+        self.assertEqual(len(messages), 3)
+        num, items = messages[1]
+        self.assertEqual(num, b"7")
+        self.assertNotIn("UID", items)
+        self.assertEqual(items["FLAGS"], [b"\\Seen"])
+        self.assertEqual(messages[2][1]["UID"], b"12")
+
+    def test_literal_inside_bodystructure(self):
+        # Servers send non-ASCII parameter values as literals
+        filename = "résumé.pdf".encode()
+        header = _headers(3)
+        data = [
+            (
+                b'3 (UID 13 BODYSTRUCTURE (%s("APPLICATION" "PDF" ("NAME" {%d}'
+                % (PLAIN, len(filename)),
+                filename,
+            ),
+            (
+                b') NIL NIL "BASE64" 5000 NIL ("ATTACHMENT" NIL) NIL NIL) "MIXED")'
+                b" %s {%d}" % (HEADER_ITEM, len(header)),
+                header,
+            ),
+            b")",
+        ]
+        [(_, items)] = _parse_fetch_response(data)
+        structure = items["BODYSTRUCTURE"]
+        self.assertEqual(structure[1][2], [b"NAME", filename])
+        self.assertEqual(items[HEADER_ITEM.decode()], header)
+        self.assertEqual(
+            _find_text_part(structure), ("1", "iso-8859-1", "QUOTED-PRINTABLE")
+        )
+
+    def test_skips_none_and_unparseable_items(self):
+        data = [None, b"garbage", (b"1 (UID 11 BODY[1] {2}", b"hi"), b")"]
+        [(_, items)] = _parse_fetch_response(data)
+        self.assertEqual(items["BODY[1]"], b"hi")
+
+
+class FindTextPartTests(unittest.TestCase):
+    def test_multipart_alternative(self):
+        structure = _structure(b"(" + PLAIN + HTML + b' "ALTERNATIVE")')
+        self.assertEqual(
+            _find_text_part(structure), ("1", "iso-8859-1", "QUOTED-PRINTABLE")
+        )
+
+    def test_alternative_prefers_plain_after_html(self):
+        structure = _structure(b"(" + HTML + PLAIN + b' "ALTERNATIVE")')
+        self.assertEqual(_find_text_part(structure)[0], "2")
+
+    def test_mixed_with_attachments(self):
+        structure = _structure(
+            b"((" + PLAIN + HTML + b' "ALTERNATIVE")' + PDF + b' "MIXED")'
+        )
+        self.assertEqual(
+            _find_text_part(structure), ("1.1", "iso-8859-1", "QUOTED-PRINTABLE")
+        )
+
+    def test_mixed_skips_text_attachment(self):
+        structure = _structure(b"(" + PLAIN_ATTACHMENT + PLAIN + b' "MIXED")')
+        self.assertTrue(_is_attachment(structure[0]))
+        self.assertFalse(_is_attachment(structure[1]))
+        self.assertEqual(_find_text_part(structure)[0], "2")
+
+    def test_mixed_with_only_attachments(self):
+        structure = _structure(b"(" + PLAIN_ATTACHMENT + PDF + b' "MIXED")')
+        self.assertIsNone(_find_text_part(structure))
+
+    def test_single_part_html(self):
+        self.assertEqual(_find_text_part(_structure(HTML)), ("1", "utf-8", "7BIT"))
+
+    def test_multipart_html_only(self):
+        structure = _structure(b"(" + HTML + PDF + b' "MIXED")')
+        self.assertIsNone(_find_text_part(structure))
+
+    def test_attached_message_not_descended(self):
+        rfc822 = (
+            b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 900'
+            b' (NIL "Inner" NIL NIL NIL NIL NIL NIL NIL NIL) ' + PLAIN + b" 20)"
+        )
+        structure = _structure(b"(" + HTML + rfc822 + b' "MIXED")')
+        self.assertIsNone(_find_text_part(structure))
+
+    def test_missing_charset_defaults_to_utf8(self):
+        structure = _structure(b'("TEXT" "PLAIN" NIL NIL NIL NIL 10 1)')
+        self.assertEqual(_find_text_part(structure), ("1", "utf-8", "7bit"))
+
+
+class FakeIMAP:
+    """Replays captured imaplib responses for _fetch_window."""
+
+    def __init__(self, search, first_pass, bodies):
+        self.search = search
+        self.first_pass = first_pass
+        self.bodies = bodies
+        self.commands = []
+
+    def select(self, mailbox, readonly=False):
+        return "OK", [b"3"]
+
+    def response(self, code):
+        return code, [b"1"] if code == "UIDVALIDITY" else [None]
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        if command == "SEARCH":
+            return "OK", [self.search]
+        if "BODYSTRUCTURE" in args[1]:
+            return "OK", self.first_pass
+        section = args[1][len("(BODY.PEEK[") : -len("])")]
+        return "OK", self.bodies[section]
+
+
+class FetchWindowTests(unittest.TestCase):
+    def test_fetches_text_sections_and_ignores_unsolicited_lines(self):
+        imap = FakeIMAP(
+            b"11 12 13",
+            _first_pass(1, 11, PLAIN)
+            + [b"5 (FLAGS (\\Seen))"]
+            + _first_pass(2, 12, b"(" + HTML + PLAIN + b' "ALTERNATIVE")')
+            + _first_pass(3, 13, b"(" + HTML + PDF + b' "MIXED")'),
+            {
+                "1": [(b"1 (UID 11 BODY[1] {9}", b"caf=E9 ok"), b")"],
+                "2": [(b"2 (BODY[2] {10}", b"second=3Dx"), b" UID 12)"],
+            },
+        )
+
+        emails, state = _fetch_window(imap, "2025-11-01", "2025-11-05")
+
+        self.assertEqual(state, {"uidvalidity": 1, "highestmodseq": None})
+        self.assertEqual(
+            [e["id"] for e in emails],
+            ["<1@example.com>", "<2@example.com>", "<3@example.com>"],
+        )
+        self.assertEqual(emails[0]["sender"], "Sender 1 <s1@example.com>")
+        self.assertEqual(emails[0]["body"].strip(), "café ok")
+        self.assertEqual(emails[1]["body"].strip(), "second=x")
+        self.assertEqual(emails[2]["body"], "")
+        # One bulk FETCH per distinct text section
+        self.assertEqual(
+            [c[1:] for c in imap.commands if c[0] == "FETCH"][1:],
+            [(b"11", "(BODY.PEEK[1])"), (b"12", "(BODY.PEEK[2])")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
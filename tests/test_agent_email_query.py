@@ -0,0 +1,115 @@
+"""Tests for the metadata-only answers in agent_email_query."""
+
+import unittest
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agent_email_query import _sender_matches, answer_from_metadata
+
+SENDERS = [
+    "S1 <s1@example.com>",
+    "S10 <s10@example.com>",
+    "Anna Smith <anna@example.org>",
+    "bob@example.net",
+]
+
+
+class AnswerFromMetadataTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Three emails from each sender, in an in-memory collection
+        cls.vectorstore = Chroma(
+            collection_name="test_answer_from_metadata",
+            embedding_function=DeterministicFakeEmbedding(size=8),
+        )
+        cls.vectorstore.add_texts(
+            [f"body {i}" for i in range(12)],
+            metadatas=[{"sender": SENDERS[i % 4]} for i in range(12)],
+            ids=[str(i) for i in range(12)],
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.vectorstore.delete_collection()
+
+    def answer(self, question):
+        return answer_from_metadata(self.vectorstore, question)
+
+    def test_count_question(self):
+        self.assertEqual(
+            self.answer("How many emails did I receive?"),
+            "You have 12 emails indexed.",
+        )
+        self.assertEqual(self.answer("how many messages"), "You have 12 emails indexed.")
+
+    def test_from_name_word(self):
+        self.assertEqual(
+            self.answer("How many emails did I get from Anna?"),
+            "You received 3 emails from Anna.",
+        )
+        self.assertEqual(
+            self.answer("How many emails from smith"),
+            "You received 3 emails from smith.",
+        )
+
+    def test_from_name_word_is_not_a_prefix_match(self):
+        # "S1" must not also count S10
+        self.assertEqual(
+            self.answer("How many emails from S1?"), "You received 3 emails from S1."
+        )
+
+    def test_from_address(self):
+        self.assertEqual(
+            self.answer("How many emails from s10@example.com?"),
+            "You received 3 emails from s10@example.com.",
+        )
+        self.assertEqual(
+            self.answer("How many emails from bob@example.net"),
+            "You received 3 emails from bob@example.net.",
+        )
+
+    def test_from_local_part(self):
+        self.assertEqual(
+            self.answer("How many emails from bob?"), "You received 3 emails from bob."
+        )
+
+    def test_time_words_fall_through(self):
+        self.assertIsNone(self.answer("How many emails from today?"))
+        self.assertIsNone(self.answer("How many emails did I receive from yesterday?"))
+
+    def test_qualified_questions_fall_through(self):
+        self.assertIsNone(self.answer("How many emails from S1 last week?"))
+        self.assertIsNone(self.answer("How many emails from Anna about the budget?"))
+        self.assertIsNone(self.answer("How many emails did I receive in March?"))
+
+    def test_unknown_sender_falls_through(self):
+        self.assertIsNone(self.answer("How many emails from nobody?"))
+        # A single letter is not a substring match on every sender
+        self.assertIsNone(self.answer("How many emails from a?"))
+
+    def test_list_senders(self):
+        answer = self.answer("List all senders")
+        self.assertTrue(answer.startswith("You received emails from 4 senders:\n"))
+        for sender in SENDERS:
+            self.assertIn(f"- {sender} (3 emails)", answer)
+        self.assertEqual(self.answer("Who sent me emails?"), answer)
+
+    def test_other_questions_fall_through(self):
+        self.assertIsNone(self.answer("Summarize my emails"))
+
+
+class SenderMatchesTests(unittest.TestCase):
+    def test_address_must_match_exactly(self):
+        self.assertTrue(_sender_matches("S1 <s1@example.com>", "s1@example.com"))
+        self.assertFalse(_sender_matches("S10 <s10@example.com>", "s1@example.com"))
+
+    def test_word_matches_display_name_or_local_part(self):
+        self.assertTrue(_sender_matches("Anna Smith <anna@example.org>", "smith"))
+        self.assertTrue(_sender_matches("Jo <jo.doe@example.org>", "doe"))
+        self.assertFalse(_sender_matches("Anna Smith <anna@example.org>", "ann"))
+        self.assertFalse(_sender_matches("Anna Smith <anna@example.org>", "example"))
+
+
+if __name__ == "__main__":
+    unittest.main()
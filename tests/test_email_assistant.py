@@ -0,0 +1,89 @@
+"""Tests for the hand-written command-line parsing in email_assistant."""
+
+import unittest
+
+from email_assistant import _build_parser, _parse_args_fast
+
+
+class ParseArgsFastTests(unittest.TestCase):
+    def assertParsesLikeArgparse(self, argv, **expected):
+        """Check the fast parser accepts argv and agrees with argparse."""
+        args = _parse_args_fast(argv)
+        self.assertIsNotNone(args, argv)
+        self.assertEqual(vars(args), vars(_build_parser().parse_args(argv)))
+        for name, value in expected.items():
+            self.assertEqual(getattr(args, name), value)
+
+    def test_bare_commands(self):
+        for command in ("status", "refresh", "query", "workflow"):
+            self.assertParsesLikeArgparse(
+                [command],
+                command=command,
+                start=None,
+                end=None,
+                question=None,
+                no_cache=False,
+            )
+
+    def test_option_with_separate_value(self):
+        self.assertParsesLikeArgparse(
+            ["refresh", "--start", "2025-01-01", "--end", "2025-02-01"],
+            start="2025-01-01",
+            end="2025-02-01",
+        )
+
+    def test_option_with_equals_value(self):
+        self.assertParsesLikeArgparse(
+            ["refresh", "--start=2025-01-01", "--end=2025-02-01"],
+            start="2025-01-01",
+            end="2025-02-01",
+        )
+        self.assertParsesLikeArgparse(["query", "--question=a=b"], question="a=b")
+
+    def test_short_question_option(self):
+        self.assertParsesLikeArgparse(
+            ["query", "-q", "How many emails did I receive?"],
+            question="How many emails did I receive?",
+        )
+        self.assertParsesLikeArgparse(["query", "-q=Summarize"], question="Summarize")
+
+    def test_no_cache_flag(self):
+        self.assertParsesLikeArgparse(["query", "--no-cache"], no_cache=True)
+        self.assertParsesLikeArgparse(
+            ["workflow", "--no-cache", "-q", "hi"], no_cache=True, question="hi"
+        )
+
+    def test_last_repeated_option_wins(self):
+        self.assertParsesLikeArgparse(
+            ["query", "-q", "a", "--question", "b"], question="b"
+        )
+
+    def test_missing_value_falls_back(self):
+        self.assertIsNone(_parse_args_fast(["query", "-q"]))
+        self.assertIsNone(_parse_args_fast(["refresh", "--start"]))
+
+    def test_dash_prefixed_value_falls_back(self):
+        self.assertIsNone(
+            _parse_args_fast(["refresh", "--start", "--end", "2025-01-01"])
+        )
+        self.assertIsNone(_parse_args_fast(["query", "-q", "-1 emails?"]))
+        self.assertIsNone(_parse_args_fast(["query", "--question=-x"]))
+
+    def test_unknown_tokens_fall_back(self):
+        self.assertIsNone(_parse_args_fast(["query", "extra"]))
+        self.assertIsNone(_parse_args_fast(["query", "--verbose"]))
+        self.assertIsNone(_parse_args_fast(["query", "--no-cache=1"]))
+        # Abbreviations and attached short values are left to argparse
+        self.assertIsNone(_parse_args_fast(["query", "--quest", "hi"]))
+        self.assertIsNone(_parse_args_fast(["query", "-qhi"]))
+        self.assertIsNone(_parse_args_fast(["query", "--", "hi"]))
+
+    def test_help_and_unknown_commands_fall_back(self):
+        self.assertIsNone(_parse_args_fast([]))
+        self.assertIsNone(_parse_args_fast(["--help"]))
+        self.assertIsNone(_parse_args_fast(["query", "--help"]))
+        self.assertIsNone(_parse_args_fast(["search"]))
+
+
+if __name__ == "__main__":
+    unittest.main()